@@ -1,19 +1,71 @@
 import numpy as np
 import threading
 from collections import deque
+from itertools import groupby
 
 from streamlit_webrtc import AudioProcessorBase
-from scipy.signal import resample_poly
 
 from utils.parameters import SR
+from utils.resampler import StreamingResampler
+from utils.level_meter import LevelMeter
+
+
+class ChunkStore:
+    """Keeps whole audio frames as float32 arrays along with their int16 PCM bytes."""
+
+    def __init__(self, sr):
+        self.chunks = deque()
+        self.pcm_chunks = deque()
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.meter = LevelMeter(sr)
+        self.n_samples = 0
+
+    def __len__(self):
+        return self.n_samples
+
+    def push(self, audio):
+        audio = np.asarray(audio, dtype=np.float32)
+        pcm16 = (np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes()
+        with self.lock:
+            self.chunks.append(audio)
+            self.pcm_chunks.append(pcm16)
+            self.n_samples += audio.size
+            self.meter.update(audio)
+            self.ready.notify_all()
+
+    def pop(self, clear=True, pcm=False):
+        with self.lock:
+            return self._pop(clear, pcm)
+
+    def _pop(self, clear, pcm=False):
+        """Returns the stored audio as one float32 array, or its PCM bytes (lock must be held)."""
+        if not self.chunks:
+            return None
+        if pcm:
+            out = self.pcm_chunks[0] if len(self.pcm_chunks) == 1 else b"".join(self.pcm_chunks)
+        else:
+            out = self.chunks[0] if len(self.chunks) == 1 else np.concatenate(self.chunks)
+        if clear:
+            self.clear()
+        return out
+
+    def clear(self):
+        self.chunks.clear()
+        self.pcm_chunks.clear()
+        self.n_samples = 0
+        self.meter.reset()
 
 
 class AudioProcessor(AudioProcessorBase):
     def __init__(self):
-        self.buffer = deque()
-        self.lock = threading.Lock()
         self.sr = SR
+        self.buffer = ChunkStore(self.sr)
+        self.lock = self.buffer.lock
+        self.meter = self.buffer.meter
         self.min_samples = self.sr * 0.2
+        self.running = True
+        self.resamplers = {}
 
     def _to_float32(self, data: np.ndarray) -> np.ndarray:
         if np.issubdtype(data.dtype, np.integer):
@@ -24,56 +76,74 @@ class AudioProcessor(AudioProcessorBase):
         return data.astype(np.float32)
 
     def _to_mono(self, data, frames) -> np.ndarray:
-        if frames.layout.name == 'mono':
-            return data
-        if data.ndim == 2:
-            axis = 0 if data.shape[0] <= 8 else 1
-            return np.mean(data, axis=axis, dtype=np.float32)
-        if data.ndim == 1:
-            return data.reshape(-1, 2).mean(axis=1)
-        return data
-    
+        n_channels = len(frames.layout.channels)
+        if n_channels == 1:
+            return data[0]
+        if frames.format.is_planar:
+            return np.mean(data, axis=0, dtype=np.float32)
+        return data[0].reshape(-1, n_channels).mean(axis=1, dtype=np.float32)
+
+    def _resample(self, audio, sample_rate):
+        key = (sample_rate, self.sr)
+        if key not in self.resamplers:
+            self.resamplers[key] = StreamingResampler(*key)
+        return self.resamplers[key].process(audio)
+
+    def _process_frames(self, frames):
+        """Converts, downmixes and resamples consecutive frames sharing the same format in one pass."""
+        chunks = []
+        for _, group in groupby(frames, key=lambda f: (f.sample_rate, f.format.name, f.layout.name)):
+            group = list(group)
+            audio = np.concatenate([frame.to_ndarray() for frame in group], axis=1)
+            audio_float = self._to_float32(audio)
+            audio_mono = self._to_mono(audio_float, group[0])
+            chunks.append(self._resample(audio_mono, group[0].sample_rate))
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
     def recv(self, frames):
-        audio = frames.to_ndarray()
-        audio_float = self._to_float32(audio[0])
-        audio_mono = self._to_mono(audio_float, frames).astype(np.float32)
-        audio_mono_16k = resample_poly(audio_mono, up=self.sr, down=frames.sample_rate)
+        self.fill_buffer(self._process_frames([frames]))
+        return frames
 
-        self.buffer.extend(audio_mono_16k.tolist())
+    async def recv_queued(self, frames):
+        if not frames:
+            return frames
+        self.fill_buffer(self._process_frames(frames))
         return frames
 
     def fill_buffer(self, audio):
-        with self.lock:
-            self.buffer.append(audio)
-            total_samples = sum(arr.size for arr in self.buffer)
-            while len(self.buffer) > 0:
-                removed = self.buffer.popleft()
-                total_samples -= removed.size
+        self.buffer.push(audio)
 
-    def pop_buffer(self, clear=True, db_threshold=-40):
-        with self.lock:
-            if not self.buffer:
-                return None
-            arr = np.concatenate(list(self.buffer)).astype(np.float32)
-
-        if len(arr) < self.min_samples or level_from_buffer(arr) < db_threshold:
+    def _pop(self, clear, db_threshold, pcm):
+        """Pops the buffered audio if there is enough of it and it is loud enough (lock must be held)."""
+        if len(self.buffer) < self.min_samples or self.meter.total_db < db_threshold:
             return None
-        if clear:
-            self.buffer.clear()
-        print(np.shape(arr))
-        return arr
+        return self.buffer._pop(clear, pcm)
 
+    def pop_buffer(self, clear=True, db_threshold=-40):
+        with self.lock:
+            return self._pop(clear, db_threshold, pcm=False)
 
-def level_from_buffer(buffer):
-    sq_mean = np.nanmean(buffer ** 2)
-    if sq_mean <= 0 or np.isnan(sq_mean):
-        return -200
-
-    rms = np.sqrt(sq_mean)
-    db = 20 * np.log10(rms + 1e-6)
-
-    return db
-
+    def pop_pcm(self, clear=True, db_threshold=-40):
+        """Same as pop_buffer but returns the int16 PCM bytes expected by the API."""
+        with self.lock:
+            return self._pop(clear, db_threshold, pcm=True)
+
+    def wait_pcm(self, timeout=None, db_threshold=-40):
+        """Blocks until enough audio is buffered (at most `timeout` seconds), then same as pop_pcm.
+
+        Audio too quiet to be sent is dropped, so the next call waits for new audio again.
+        """
+        with self.buffer.ready:
+            self.buffer.ready.wait_for(lambda: len(self.buffer) >= self.min_samples or not self.running, timeout)
+            pcm16 = self._pop(True, db_threshold, pcm=True)
+            if pcm16 is None and len(self.buffer) >= self.min_samples:
+                self.buffer.clear()
+            return pcm16
+
+    def stop(self):
+        with self.buffer.ready:
+            self.running = False
+            self.buffer.ready.notify_all()
 
 def normalize_buffer(buffer, target_mean=0.1):
     rms = np.sqrt(np.mean(buffer**2))
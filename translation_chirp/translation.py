@@ -6,7 +6,7 @@ from google.cloud.speech_v2 import SpeechClient
 from google.cloud.speech_v2.types import cloud_speech
 from google.api_core.client_options import ClientOptions
 
-from utils.parameters import SR
+from utils.parameters import SR, KEEPALIVE_INTERVAL
 
 
 PROJECT_ID = "formal-wonder-477401-g4"
@@ -16,29 +16,40 @@ RECOGNIZER = f"projects/{PROJECT_ID}/locations/{REGION}/recognizers/_"
 MODEL = "chirp_3"
 
 
+class KeepAlive:
+    """Tells when a silence chunk is needed to keep the stream from timing out."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last_sent = time.monotonic()
+
+    def sent(self):
+        self.last_sent = time.monotonic()
+
+    def time_left(self):
+        return max(0.0, self.interval - (time.monotonic() - self.last_sent))
+
+
 def google_audio_generator(ctx):
     audio_proc = ctx.audio_processor
 
     # Chunk initial silence pour lancer le stream
-    silence = np.zeros(int(SR * 0.2), dtype=np.float32)
-    pcm16 = (np.clip(silence, -1, 1) * 32767).astype(np.int16).tobytes()
-    print(pcm16)
+    pcm16 = np.zeros(int(SR * 0.2), dtype=np.int16).tobytes()
     yield cloud_speech.StreamingRecognizeRequest(audio=pcm16)
-    print("test13")
-
-    while True:
-        chunk = audio_proc.pop_buffer(clear=True, db_threshold=-100)
-        if chunk is None:
-            dummy = np.zeros(int(SR * 0.05), dtype=np.float32)  # 50ms
-            pcm16 = (np.clip(dummy, -1, 1) * 32767).astype(np.int16).tobytes()
-            yield cloud_speech.StreamingRecognizeRequest(audio=pcm16)
-            time.sleep(0.02)
+
+    silence = np.zeros(int(SR * 0.05), dtype=np.int16).tobytes()  # 50ms
+    keep_alive = KeepAlive(KEEPALIVE_INTERVAL)
+    while audio_proc.running:
+        # wakes up as soon as audio arrives, or when the keep-alive is due
+        pcm16 = audio_proc.wait_pcm(timeout=keep_alive.time_left(), db_threshold=-100)
+        if pcm16 is None:
+            if keep_alive.time_left() == 0:
+                yield cloud_speech.StreamingRecognizeRequest(audio=silence)
+                keep_alive.sent()
             continue
 
-        print("chunk shape:", chunk.shape, "dtype:", chunk.dtype)
-        pcm16 = (np.clip(chunk, -1, 1) * 32767).astype(np.int16).tobytes()
-        print(pcm16)
         yield cloud_speech.StreamingRecognizeRequest(audio=pcm16)
+        keep_alive.sent()
 
 
 def google_streaming_stt(ctx, lang='fr-FR'):
@@ -2,4 +2,7 @@ SR = 16000
 
 STEP = 3
 OVERLAP_PAST = 1
-OVERLAP_FUTURE = 0.2
\ No newline at end of file
+OVERLAP_FUTURE = 0.2
+
+# Google streaming: silence is sent only if no audio was sent for this long (seconds)
+KEEPALIVE_INTERVAL = 5
\ No newline at end of file
@@ -2,6 +2,7 @@
 import queue
 import re
 import sys
+import threading
 import time
 
 from google.cloud import speech
@@ -27,6 +28,48 @@ def get_current_time() -> int:
     return int(round(time.time() * 1000))
 
 
+class AudioRingBuffer:
+    """Fixed-size byte ring indexed by absolute byte offsets since the start of the session.
+
+    Holds the audio from `start` to `end`; appending past the capacity drops the oldest bytes.
+    """
+
+    def __init__(self: object, capacity: int) -> None:
+        self._buf = bytearray(capacity)
+        self._lock = threading.Lock()
+        self.start = 0
+        self.end = 0
+
+    def append(self: object, data: bytes) -> None:
+        """Appends `data` at the end of the ring, overwriting the oldest bytes if full."""
+        capacity = len(self._buf)
+        with self._lock:
+            n = len(data)
+            if n > capacity:
+                data, self.end = data[-capacity:], self.end + n - capacity
+                n = capacity
+            pos = self.end % capacity
+            first = min(n, capacity - pos)
+            self._buf[pos : pos + first] = data[:first]
+            self._buf[: n - first] = data[first:]
+            self.end += n
+            self.start = max(self.start, self.end - capacity)
+
+    def discard_until(self: object, offset: int) -> None:
+        """Forgets the bytes before the absolute `offset`."""
+        with self._lock:
+            self.start = min(max(self.start, offset), self.end)
+
+    def read_from(self: object, offset: int) -> bytes:
+        """Returns the bytes from the absolute `offset` (or the oldest kept) to the end."""
+        capacity = len(self._buf)
+        with self._lock:
+            offset = min(max(offset, self.start), self.end)
+            pos, n = offset % capacity, self.end - offset
+            first = min(n, capacity - pos)
+            return bytes(self._buf[pos : pos + first]) + bytes(self._buf[: n - first])
+
+
 class ResumableMicrophoneStream:
     """Opens a recording stream as a generator yielding the audio chunks."""
 
@@ -51,12 +94,12 @@ class ResumableMicrophoneStream:
         self.closed = True
         self.start_time = get_current_time()
         self.restart_counter = 0
-        self.audio_input = []
-        self.last_audio_input = []
+        # audio not finalized yet, at most one request long
+        self._bytes_per_ms = rate * 2 / 1000  # 16-bit mono
+        self.audio = AudioRingBuffer(self.ms_to_offset(STREAMING_LIMIT))
+        self.request_start = 0  # absolute byte offset of the first byte sent in the current request
+        self.final_offset = 0  # absolute byte offset of the end of the last final result
         self.result_end_time = 0
-        self.is_final_end_time = 0
-        self.final_request_end_time = 0
-        self.bridging_offset = 0
         self.last_transcript_was_final = False
         self.new_stream = True
         self._audio_interface = pyaudio.PyAudio()
@@ -107,6 +150,39 @@ class ResumableMicrophoneStream:
         self._buff.put(None)
         self._audio_interface.terminate()
 
+    def ms_to_offset(self: object, ms: int) -> int:
+        """Converts a duration in ms to a number of bytes, on a sample boundary."""
+        return int(ms * self._rate / 1000) * 2
+
+    def offset_to_ms(self: object, offset: int) -> int:
+        """Converts an absolute byte offset to ms since the start of the session."""
+        return int(offset / self._bytes_per_ms)
+
+    def finalize(self: object, result_end_time: int) -> None:
+        """Records a final result ending at `result_end_time` ms into the current request.
+
+        Args:
+        self: The class instance.
+        result_end_time: The end of the final result, relative to the request audio.
+
+        returns: None
+        """
+        self.final_offset = max(self.final_offset, self.request_start + self.ms_to_offset(result_end_time))
+        self.audio.discard_until(self.final_offset)
+
+    def restart(self: object) -> None:
+        """Prepares a new request, which will replay the audio after the last final result.
+
+        Args:
+        self: The class instance.
+
+        returns: None
+        """
+        self.request_start = max(self.final_offset, self.audio.start)
+        self.result_end_time = 0
+        self.restart_counter = self.restart_counter + 1
+        self.new_stream = True
+
     def _fill_buffer(
         self: object,
         in_data: object,
@@ -138,39 +214,22 @@ class ResumableMicrophoneStream:
         while not self.closed:
             data = []
 
-            if self.new_stream and self.last_audio_input:
-                chunk_time = STREAMING_LIMIT / len(self.last_audio_input)
-
-                if chunk_time != 0:
-                    if self.bridging_offset < 0:
-                        self.bridging_offset = 0
-
-                    if self.bridging_offset > self.final_request_end_time:
-                        self.bridging_offset = self.final_request_end_time
-
-                    chunks_from_ms = round(
-                        (self.final_request_end_time - self.bridging_offset)
-                        / chunk_time
-                    )
-
-                    self.bridging_offset = round(
-                        (len(self.last_audio_input) - chunks_from_ms) * chunk_time
-                    )
-
-                    for i in range(chunks_from_ms, len(self.last_audio_input)):
-                        data.append(self.last_audio_input[i])
-
+            if self.new_stream:
+                # replay what was heard after the last final result, from its exact offset
+                bridging = self.audio.read_from(self.request_start)
+                if bridging:
+                    data.append(bridging)
                 self.new_stream = False
 
             # Use a blocking get() to ensure there's at least one chunk of
             # data, and stop iteration if the chunk is None, indicating the
             # end of the audio stream.
             chunk = self._buff.get()
-            self.audio_input.append(chunk)
 
             if chunk is None:
                 return
             data.append(chunk)
+            self.audio.append(chunk)
             # Now consume whatever other data's still buffered.
             while True:
                 try:
@@ -178,7 +237,7 @@ class ResumableMicrophoneStream:
                     if chunk is None:
                         return
                     data.append(chunk)
-                    self.audio_input.append(chunk)
+                    self.audio.append(chunk)
 
                 except queue.Empty:
                     break
@@ -231,11 +290,7 @@ def listen_print_loop(responses: object, stream: object) -> None:
 
         stream.result_end_time = int((result_seconds * 1000) + (result_micros / 1000))
 
-        corrected_time = (
-            stream.result_end_time
-            - stream.bridging_offset
-            + (STREAMING_LIMIT * stream.restart_counter)
-        )
+        corrected_time = stream.offset_to_ms(stream.request_start) + stream.result_end_time
         # Display interim results, but with a carriage return at the end of the
         # line, so subsequent lines will overwrite them.
 
@@ -244,7 +299,7 @@ def listen_print_loop(responses: object, stream: object) -> None:
             sys.stdout.write("\033[K")
             sys.stdout.write(str(corrected_time) + ": " + transcript + "\n")
 
-            stream.is_final_end_time = stream.result_end_time
+            stream.finalize(stream.result_end_time)
             stream.last_transcript_was_final = True
 
             # Exit recognition if any of the transcribed phrases could be
@@ -287,10 +342,9 @@ def main() -> None:
         while not stream.closed:
             sys.stdout.write(YELLOW)
             sys.stdout.write(
-                "\n" + str(STREAMING_LIMIT * stream.restart_counter) + ": NEW REQUEST\n"
+                "\n" + str(stream.offset_to_ms(stream.request_start)) + ": NEW REQUEST\n"
             )
 
-            stream.audio_input = []
             audio_generator = stream.generator()
 
             requests = (
@@ -303,17 +357,9 @@ def main() -> None:
             # Now, put the transcription responses to use.
             listen_print_loop(responses, stream)
 
-            if stream.result_end_time > 0:
-                stream.final_request_end_time = stream.is_final_end_time
-            stream.result_end_time = 0
-            stream.last_audio_input = []
-            stream.last_audio_input = stream.audio_input
-            stream.audio_input = []
-            stream.restart_counter = stream.restart_counter + 1
-
             if not stream.last_transcript_was_final:
                 sys.stdout.write("\n")
-            stream.new_stream = True
+            stream.restart()
 
 
 if __name__ == "__main__":
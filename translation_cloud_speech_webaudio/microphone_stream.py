@@ -1,18 +1,22 @@
 import numpy as np
 import queue
+from itertools import groupby
 
 from streamlit_webrtc import AudioProcessorBase
-from scipy.signal import resample_poly
 
 from utils.parameters import SR, CHUNK
+from utils.resampler import StreamingResampler, StreamingDecimatorInt16
 
 
 class AudioProcessor(AudioProcessorBase):
     def __init__(self):
         self.buffer = queue.Queue()
-        self._temp_buffer = []
+        self._chunk = np.empty(CHUNK, dtype=np.int16)
+        self._chunk_len = 0
         self.running = True
         self.inter_process = False
+        self.resamplers = {}
+        self.decimators = {}
 
     def _to_float32(self, data: np.ndarray) -> np.ndarray:
         if np.issubdtype(data.dtype, np.integer):
@@ -23,34 +27,82 @@ class AudioProcessor(AudioProcessorBase):
         return data.astype(np.float32)
 
     def _to_mono(self, data, frames) -> np.ndarray:
-        if frames.layout.name == 'mono':
-            return data
-        if data.ndim == 2:
-            axis = 0 if data.shape[0] <= 8 else 1
-            return np.mean(data, axis=axis, dtype=np.float32)
-        if data.ndim == 1:
-            return data.reshape(-1, 2).mean(axis=1)
-        return data
+        n_channels = len(frames.layout.channels)
+        if n_channels == 1:
+            return data[0]
+        if frames.format.is_planar:
+            return np.mean(data, axis=0, dtype=np.float32)
+        return data[0].reshape(-1, n_channels).mean(axis=1, dtype=np.float32)
+
+    def _to_mono_int(self, data, frames) -> np.ndarray:
+        n_channels = len(frames.layout.channels)
+        if n_channels == 1:
+            return data[0]
+        channels = data if frames.format.is_planar else [data[0][c::n_channels] for c in range(n_channels)]
+        mono = channels[0].astype(np.int32)
+        for channel in channels[1:]:
+            mono += channel
+        mono //= n_channels
+        return mono
+
+    def _is_int16_path(self, frames):
+        return frames.format.name in ("s16", "s16p") and frames.sample_rate % SR == 0
+
+    def _decimate(self, audio, sample_rate):
+        key = (sample_rate, SR)
+        if key not in self.decimators:
+            self.decimators[key] = StreamingDecimatorInt16(*key)
+        return self.decimators[key].process(audio)
+
+    def _resample(self, audio, sample_rate):
+        key = (sample_rate, SR)
+        if key not in self.resamplers:
+            self.resamplers[key] = StreamingResampler(*key)
+        return self.resamplers[key].process(audio)
+
+    def _process_frames(self, frames):
+        """Converts, downmixes and resamples consecutive frames sharing the same format in one pass.
+
+        16-bit input at a multiple of 16 kHz stays in integer arithmetic up to the outgoing chunk,
+        other formats go through float32.
+        """
+        for _, group in groupby(frames, key=lambda f: (f.sample_rate, f.format.name, f.layout.name)):
+            group = list(group)
+            audio = np.concatenate([frame.to_ndarray() for frame in group], axis=1)
+            if self._is_int16_path(group[0]):
+                audio_mono = self._to_mono_int(audio, group[0])
+                self._fill_chunks(self._decimate(audio_mono, group[0].sample_rate))
+            else:
+                audio_float = self._to_float32(audio)
+                audio_mono = self._to_mono(audio_float, group[0])
+                self.fill_buffer(self._resample(audio_mono, group[0].sample_rate))
 
     def recv(self, frames):
-        audio = frames.to_ndarray()
-        audio_float = self._to_float32(audio[0])
-        audio_mono = self._to_mono(audio_float, frames).astype(np.float32)
-        audio_mono_16k = resample_poly(audio_mono, up=SR, down=frames.sample_rate)
-        self.fill_buffer(audio_mono_16k)
+        self._process_frames([frames])
+        return frames
+
+    async def recv_queued(self, frames):
+        if not frames:
+            return frames
+        self._process_frames(frames)
         return frames
 
     def fill_buffer(self, audio):
-        audio_int16 = (audio * 32767).astype(np.int16)
-        self._temp_buffer.extend(audio_int16) 
+        self._fill_chunks(np.clip(audio * 32767, -32768, 32767))
 
-        if len(self._temp_buffer) >= CHUNK:
-            # conversion en octets car c'est attendu par l'API
-            segment_np = np.array(self._temp_buffer, dtype=np.int16)
-            audio_bytes = segment_np.tobytes()
+    def _fill_chunks(self, audio):
+        # copy the samples into the preallocated chunk, leftover samples are kept for the next chunk
+        pos = 0
+        while pos < len(audio):
+            n = min(CHUNK - self._chunk_len, len(audio) - pos)
+            self._chunk[self._chunk_len : self._chunk_len + n] = audio[pos : pos + n]
+            self._chunk_len += n
+            pos += n
 
-            self.buffer.put(audio_bytes)
-            self._temp_buffer = []
+            if self._chunk_len == CHUNK:
+                # conversion en octets car c'est attendu par l'API
+                self.buffer.put(self._chunk.tobytes())
+                self._chunk_len = 0
 
     def generator(self):
         while self.running and not self.inter_process:
@@ -72,7 +124,7 @@ class AudioProcessor(AudioProcessorBase):
                 except queue.Empty:
                     break
 
-            yield b"".join(data)
+            yield data[0] if len(data) == 1 else b"".join(data)
 
     def stop(self):
         if self.running:
@@ -0,0 +1,67 @@
+import re
+from difflib import SequenceMatcher
+
+
+def _norm(word):
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def split_words(chunks, duration):
+    """Words of the pipeline `chunks` as (start, text), whatever their level.
+
+    Word chunks are kept as they are. The words of a segment chunk get start times spread over
+    the segment in proportion to their characters, and text without timestamps is one segment
+    over the whole window (`duration`, in seconds).
+    """
+    words = []
+    for chunk in chunks:
+        start, end = chunk["timestamp"]
+        start = 0.0 if start is None else start
+        end = duration if end is None else end
+        tokens = chunk["text"].split()
+        n_chars = sum(len(t) for t in tokens)
+        position = 0
+        for token in tokens:
+            words.append((start + (end - start) * position / max(n_chars, 1), token))
+            position += len(token)
+    return words
+
+
+def crop_words(words, start, end):
+    """Words starting in [start, end] (seconds from the window start)."""
+    return [text for t, text in words if start <= t <= end]
+
+
+def reconcile(previous, words, min_match=2):
+    """Index of the first word of `words` not already in the `previous` text.
+
+    The new hypothesis starts inside audio that was already transcribed, so the end of `previous`
+    should be found near its beginning: the cut is after the last run of at least `min_match`
+    words shared with `previous` (or one word ending `previous`). None if nothing matches.
+    """
+    if not previous:
+        return 0
+    old = [_norm(w) for w in previous.split()]
+    new = [_norm(w) for w in words]
+    cut = None
+    for block in SequenceMatcher(None, old, new, autojunk=False).get_matching_blocks():
+        if block.size >= min_match or (block.size > 0 and block.a + block.size == len(old)):
+            cut = block.b + block.size
+    return cut
+
+
+def crop(chunks, duration, start, end, previous=None):
+    """Text of the window between `start` and `end` (seconds), from chunks of any timestamp level.
+
+    With `previous` (text emitted for the previous window), the start is found by aligning the
+    hypothesis with that text rather than by time, and the time crop is the fallback.
+    """
+    words = split_words(chunks, duration)
+    if previous is None:
+        return " ".join(crop_words(words, start, end))
+
+    cut = reconcile(previous, [text for _, text in words])
+    if cut is None:
+        return " ".join(crop_words(words, start, end))
+    return " ".join(text for t, text in words[cut:] if t <= end)
+
@@ -5,12 +5,14 @@ import streamlit as st
 import torch
 
 from translation import PreProcessed, transcribe, translate, load_models
+from audio_cache import AudioCache
 from lang_list import LANGUAGE_CODES
 from display import update_boxes
 
 
 STEP = 4
 OVERLAP = 5
+CACHE_MAX_BYTES = 2 * 2**30  # decoded uploads kept on disk between reruns
 
 st.set_page_config(layout="wide")
 st.title("Transcription and translation")
@@ -20,8 +22,9 @@ uploaded = st.file_uploader("Upload audio file", type=["mp3", "wav"])
 if not uploaded:
     st.stop()
 
-preprocessed = PreProcessed(uploaded)
-audio_len = len(preprocessed.raw_data) / preprocessed.sr
+audio_cache = AudioCache(max_bytes=CACHE_MAX_BYTES)
+preprocessed = PreProcessed(uploaded, cache=audio_cache)
+audio_len = preprocessed.duration
 
 
 #------- languages choice -------#
@@ -44,9 +47,13 @@ col_load, col_play = st.columns([1, 2])
 with col_load:
     if st.button("Load models for selected languages"):
         with st.spinner("Loading models..."):
-            st.session_state.models_info = load_models(LANG_AUDIO)
+            st.session_state.models_info = load_models()
             st.session_state.models_loaded = True
         st.success("Models loaded for: " + lang_audio + " to " + lang_subtitles)
+        st.caption(" | ".join(
+            f"{key.model_id}: loaded in {info['load_s']:.1f}s, {info['bytes'] / 2**20:.0f} MB, used {info['uses']}x"
+            for key, info in st.session_state.models_info.items()
+        ))
 
 
 #------- displays initialization -------#
@@ -83,11 +90,13 @@ if st.session_state.get("running", False):
         end_time = min(time_pos + STEP, audio_len)
 
         segment = preprocessed.norm_data(start_time, end_time)
+        if len(segment) == 0:  # the duration from the headers can be slightly off
+            break
 
         # compute transcription and translation
         gen_start = time.time()
-        transc = transcribe(segment, max(min(OVERLAP, time_pos), 0.0))
-        transl = translate(transc, LANG_SUBTITLES)
+        transc = transcribe(segment, max(min(OVERLAP, time_pos), 0.0), LANG_AUDIO, previous=prev_transc)
+        transl = translate(transc, LANG_AUDIO, LANG_SUBTITLES)
         gen_time = time.time() - gen_start
 
         # wait before display
@@ -0,0 +1,73 @@
+import os
+
+import torch
+from transformers import pipeline, AutoProcessor
+
+
+class ASRBackend:
+    """Whisper engine behind `transcribe`, wrapping a transformers ASR pipeline.
+
+    Calling the backend on 16 kHz audio returns the pipeline output (`text` and timestamped
+    `chunks`). `word_timestamps` tells whether the chunks are words or whole segments.
+    """
+
+    name = None
+    word_timestamps = True
+
+    def __call__(self, audio, **kwargs):
+        return self.pipe(audio, **kwargs)
+
+
+class PipelineBackend(ASRBackend):
+    """PyTorch Whisper through the transformers pipeline, with word timestamps."""
+
+    name = "hf"
+
+    def __init__(self, model, device="cpu", dtype=torch.float32):
+        self.pipe = pipeline(
+            "automatic-speech-recognition",
+            model=model,
+            device=0 if device == "cuda" else -1,
+            dtype=dtype,
+            return_timestamps="word",
+        )
+
+
+class ORTBackend(ASRBackend):
+    """Whisper exported to ONNX and run by ONNX Runtime (optimum).
+
+    The checkpoint (hub id or local directory) is exported once to `onnx_dir` (by default an
+    `onnx` folder next to a local checkpoint), later loads only open the encoder and decoder
+    sessions. The decoder keeps its KV cache in bound buffers (IO binding) between tokens. The
+    exported decoder does not return cross-attentions, so chunks are segments, not words.
+    """
+
+    name = "ort"
+    word_timestamps = False
+
+    def __init__(self, model, device="cpu", onnx_dir=None):
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+        if onnx_dir is None:
+            if os.path.isdir(model):
+                onnx_dir = os.path.join(model, "onnx")
+            else:
+                onnx_dir = os.path.join(os.path.expanduser("~/.cache/whisper_onnx"), model.replace("/", "--"))
+        provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+
+        processor = AutoProcessor.from_pretrained(model)
+        if not os.path.exists(os.path.join(onnx_dir, "encoder_model.onnx")):
+            ORTModelForSpeechSeq2Seq.from_pretrained(model, export=True, use_cache=True).save_pretrained(onnx_dir)
+            processor.save_pretrained(onnx_dir)
+        ort_model = ORTModelForSpeechSeq2Seq.from_pretrained(onnx_dir, use_cache=True, use_io_binding=True, provider=provider)
+
+        self.pipe = pipeline(
+            "automatic-speech-recognition",
+            model=ort_model,
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor,
+            return_timestamps=True,
+        )
+
+
+BACKENDS = {backend.name: backend for backend in (PipelineBackend, ORTBackend)}
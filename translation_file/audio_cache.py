@@ -0,0 +1,134 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from decoder import decode_blocks
+
+
+class AudioCache:
+    """Decoded audio kept on disk as .npy files, keyed by the content of the upload and the sample rate.
+
+    Entries are opened memory-mapped, so reruns (and sessions uploading the same file) share
+    the pages instead of decoding again. The least recently used entries are removed once the
+    directory holds more than `max_bytes`.
+    """
+
+    _filling = set()  # keys being decoded in the background, shared by all sessions
+    _filling_lock = threading.Lock()
+
+    def __init__(self, directory=None, max_bytes=2 * 2**30):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "translation_file_cache")
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(file, sr):
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as f:
+                digest = hashlib.file_digest(f, "blake2b")
+        else:
+            digest = hashlib.blake2b(file.getbuffer())
+        return f"{digest.hexdigest()[:32]}_{sr}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def load(self, key):
+        """Returns the cached audio memory-mapped (read only), or None."""
+        path = self._path(key)
+        try:
+            audio = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)  # recently used
+        return audio
+
+    def save(self, key, audio):
+        writer = self.writer(key)
+        writer.write(audio)
+        writer.commit()
+
+    def writer(self, key):
+        return CacheWriter(self, key)
+
+    def fill_async(self, key, file, sr):
+        """Decodes `file` into the cache in a background thread, unless already in progress."""
+        with self._filling_lock:
+            if key in self._filling:
+                return
+            self._filling.add(key)
+        threading.Thread(target=self._fill, args=(key, file, sr), daemon=True).start()
+
+    def _fill(self, key, file, sr):
+        writer = self.writer(key)
+        try:
+            for block in decode_blocks(file, sr):
+                writer.write(block)
+            writer.commit()
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            with self._filling_lock:
+                self._filling.discard(key)
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries above `max_bytes`, except `keep`."""
+        entries, total = [], 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith(".tmp"):
+                # left by writers that never finished (e.g. the server stopped while decoding)
+                if time.time() - stat.st_mtime > 3600:
+                    os.remove(path)
+                continue
+            total += stat.st_size
+            if name != f"{keep}.npy":
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)  # pages already mapped by other sessions stay valid
+            total -= size
+
+
+class CacheWriter:
+    """Collects the decoded blocks of one entry in a temporary file, published by `commit`."""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.n_samples = 0
+        fd, self._tmp_path = tempfile.mkstemp(suffix=".tmp", dir=cache.directory)
+        self._tmp = os.fdopen(fd, "wb")
+
+    def write(self, block):
+        block = np.ascontiguousarray(block, dtype=np.float32)
+        self._tmp.write(block.data)
+        self.n_samples += len(block)
+
+    def commit(self):
+        self._tmp.close()
+        fd, npy_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache.directory)
+        with os.fdopen(fd, "wb") as out, open(self._tmp_path, "rb") as raw:
+            header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)), "fortran_order": False, "shape": (self.n_samples,)}
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out)
+        os.remove(self._tmp_path)
+        os.replace(npy_path, self.cache._path(self.key))
+        self.cache.evict(keep=self.key)
+
+    def abort(self):
+        self._tmp.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
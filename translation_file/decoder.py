@@ -0,0 +1,113 @@
+import io
+import os
+
+import av
+import numpy as np
+
+
+def _input(file):
+    if isinstance(file, (str, os.PathLike)):
+        return file
+    # own reader over the uploaded bytes, the upload itself is also read by st.audio
+    return io.BytesIO(file.getvalue())
+
+
+def decode_blocks(file, sr=16000):
+    """Yields the audio of `file` as mono float32 blocks at `sr`, in order."""
+    with av.open(_input(file)) as container:
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=sr)
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                yield out.to_ndarray()[0]
+        for out in resampler.resample(None):
+            yield out.to_ndarray()[0]
+
+
+class StreamingDecoder:
+    """Decodes and resamples an audio file to mono float32 block by block, as samples are requested.
+
+    Only the audio from the start of the last request to the decoded end is kept, and decoding
+    runs at most `read_ahead_s` seconds past the last requested end, so memory does not depend
+    on the file length. Reads are expected to move forward, going back restarts the decoding.
+    `transform(block)` is applied in place to each decoded block, in order (e.g. a gain control).
+    """
+
+    def __init__(self, file, sr=16000, read_ahead_s=5, transform=None):
+        self.source = file
+        self.sr = sr
+        self.read_ahead = int(read_ahead_s * sr)
+        self.transform = transform
+
+        self._buf = np.empty(0, dtype=np.float32)
+        self._blocks = None
+        self.duration = self._probe_duration()
+        self._open()
+
+    def _open(self):
+        if self._blocks is not None:
+            self._blocks.close()
+        self._blocks = decode_blocks(self.source, self.sr)
+
+        self._buf_start = 0  # absolute index of self._buf[0]
+        self._buf_len = 0
+        self._eof = False
+
+    def _probe_duration(self):
+        with av.open(_input(self.source)) as container:
+            stream = container.streams.audio[0]
+            if container.duration is not None:
+                return container.duration / av.time_base
+            if stream.duration is not None:
+                return float(stream.duration * stream.time_base)
+
+        # no duration in the headers: count the samples once
+        return sum(len(block) for block in decode_blocks(self.source, self.sr)) / self.sr
+
+    @property
+    def decoded_end(self):
+        return self._buf_start + self._buf_len
+
+    def read(self, start, end):
+        """Returns the samples between `start` and `end` seconds (a view valid until the next read)."""
+        start, end = int(start * self.sr), int(end * self.sr)
+        if start < self._buf_start:
+            self._open()
+
+        # drop what is before the request, then decode up to the request plus the read-ahead
+        self._discard_until(start)
+        while not self._eof and self.decoded_end < end + self.read_ahead:
+            self._decode_next()
+
+        begin = max(start, self._buf_start) - self._buf_start
+        stop = min(end, self.decoded_end) - self._buf_start
+        return self._buf[begin:max(begin, stop)]
+
+    def _discard_until(self, start):
+        n = min(max(0, start - self._buf_start), self._buf_len)
+        if n == 0:
+            return
+        self._buf[: self._buf_len - n] = self._buf[n : self._buf_len]
+        self._buf_start += n
+        self._buf_len -= n
+
+    def _decode_next(self):
+        try:
+            self._append(next(self._blocks))
+        except StopIteration:
+            self._eof = True
+
+    def _append(self, block):
+        n = len(block)
+        if self._buf_len + n > len(self._buf):
+            grown = np.empty(max(2 * len(self._buf), self._buf_len + n), dtype=np.float32)
+            grown[: self._buf_len] = self._buf[: self._buf_len]
+            self._buf = grown
+
+        dest = self._buf[self._buf_len : self._buf_len + n]
+        dest[:] = block
+        if self.transform is not None:
+            self.transform(dest)
+        self._buf_len += n
+
+    def close(self):
+        self._blocks.close()
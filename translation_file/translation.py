@@ -4,70 +4,200 @@ import os
 import numpy as np
 
 import torch
-import librosa
-from transformers import pipeline, M2M100Tokenizer, M2M100ForConditionalGeneration
+from transformers import M2M100Tokenizer, M2M100ForConditionalGeneration
+
+from agc import AutomaticGainControl
+from decoder import StreamingDecoder, decode_blocks
+from model_registry import registry, ModelKey
+from asr_backends import BACKENDS
+from alignment import crop
 
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DTYPE = torch.float16 if torch.cuda.is_available() else torch.float32
 
+ASR_BACKEND = "hf"  # "hf" (transformers pipeline, PyTorch) or "ort" (ONNX Runtime export)
+ASR_MODEL = "openai/whisper-medium"  # hub id or local checkpoint directory (offline)
+TIMESTAMPS = "word"  # window cropping: "word" (DTW alignment), "segment" or "text" (aligned with the previous text)
 model_name = "facebook/m2m100_418M"
-model = M2M100ForConditionalGeneration.from_pretrained(model_name).to(DEVICE)
 
-asr, tokenizer = None, None
 
+def get_asr():
+    # one pipeline for all languages, the language is given to each call
+    if ASR_BACKEND == "hf":
+        loader = lambda: BACKENDS["hf"](ASR_MODEL, device=DEVICE, dtype=DTYPE)
+    else:
+        loader = lambda: BACKENDS[ASR_BACKEND](ASR_MODEL, device=DEVICE)
+    return registry.get(ModelKey(f"{ASR_MODEL} ({ASR_BACKEND})", DEVICE, str(DTYPE), None), loader)
 
-def load_models(lang_src):
-    global asr
-    global tokenizer
 
-    asr = pipeline(
-        "automatic-speech-recognition",
-        model="openai/whisper-medium",
-        device=0 if torch.cuda.is_available() else -1,
-        dtype=torch.float16 if torch.cuda.is_available() else None,
-        return_timestamps="word",
-        language=lang_src,
+def get_translation_model():
+    return registry.get(
+        ModelKey(model_name, DEVICE, "float32", None),
+        lambda: M2M100ForConditionalGeneration.from_pretrained(model_name).to(DEVICE),
     )
-    tokenizer = M2M100Tokenizer.from_pretrained(model_name)
-    tokenizer.src_lang = lang_src
+
+
+def get_tokenizer():
+    return registry.get(ModelKey(model_name + ":tokenizer", "cpu", None, None), lambda: M2M100Tokenizer.from_pretrained(model_name))
+
+
+def load_models():
+    """Loads the models once per process, shared by all sessions (each one gives its languages to each call)."""
+    get_asr()
+    get_translation_model()
+    get_tokenizer()
+    return registry.stats()
 
 
 class PreProcessed:
-    def __init__(self, file):
-        self.file, self.sr = librosa.load(file, sr=16000, mono=True)
+    """Upload decoded to 16 kHz mono float32, normalized segment by segment.
+
+    `normalization` is "agc" (gain control running along the file) or "window" (each segment
+    scaled to the target RMS of its own window, measured in O(1) from block sums of squares
+    when the whole file is decoded).
+    """
+
+    def __init__(self, file, streaming=True, normalization="agc", target_rms=0.1, cache=None):
+        self.sr = 16000
+        self.normalization = normalization
+        self.target_rms = target_rms
+        self.agc = AutomaticGainControl(self.sr, target_rms=target_rms)
+
+        # already decoded by a previous run: memory-mapped, used as a whole-file buffer
+        key = cache.key(file, self.sr) if cache is not None else None
+        cached = cache.load(key) if cache is not None else None
+        self.streaming = streaming and cached is None
+
+        if self.streaming:
+            # blocks are decoded (and normalized by the gain control) as segments are requested,
+            # while the cache entry is decoded in the background for the next runs. The gain
+            # control is chunk-invariant, so the PyAV blocks give the same audio as the cached path
+            transform = (lambda block: self.agc.process(block)) if normalization == "agc" else None
+            self.decoder = StreamingDecoder(file, sr=self.sr, transform=transform)
+            self._last_start = 0
+            self.duration = self.decoder.duration
+            if cache is not None:
+                cache.fill_async(key, file, self.sr)
+        else:
+            if cached is None:
+                # same decoder as the streaming path and the cache, for the same samples
+                cached = np.concatenate(list(decode_blocks(file, self.sr)))
+                if cache is not None:
+                    cache.save(key, cached)
+            # never written to: on a cache hit the memory-mapped pages are shared between sessions
+            self.file = np.ascontiguousarray(cached, dtype=np.float32)
+            self.duration = len(self.file) / self.sr
+            self._block_sq = None
+
+            # normalized samples [_norm_start, _norm_end) of the last segment only, the gain
+            # control carrying its state from one segment to the next
+            self._norm = np.empty(0, dtype=np.float32)
+            self._norm_start = self._norm_end = 0
 
     @property
     def raw_data(self):
-        return self.file.astype(np.float32)
-    
-    def norm_data(self, start, end, all=False):
-        data = self.raw_data if all else self.raw_data[int(start * self.sr) : int(end * self.sr)]
-
-        target_rms = 0.1
-        rms = np.sqrt(np.mean(data**2))
-        return data * (target_rms / (rms + 1e-9))
+        if self.streaming:
+            raise AttributeError("raw_data is not available when streaming, use norm_data")
+        return self.file
+
+    def _samples(self, start, end, all):
+        if all:
+            return 0, len(self.file)
+        return int(start * self.sr), min(int(end * self.sr), len(self.file))
+
+    def window_rms(self, start, end, all=False):
+        """RMS of the raw audio between `start` and `end` seconds, from 10 ms block sums of squares."""
+        start, end = self._samples(start, end, all)
+        if end <= start:
+            return 0.0
+        block = self.sr // 100
+        if self._block_sq is None:
+            n_blocks = len(self.file) // block
+            blocks = self.file[: n_blocks * block].reshape(n_blocks, block)
+            self._block_sq = np.concatenate(([0.0], np.cumsum(np.einsum("ij,ij->i", blocks, blocks, dtype=np.float64))))
+
+        # whole blocks from the prefix sums, the partial blocks at both ends directly
+        first, last = -(-start // block), end // block
+        if first >= last:
+            part = self.file[start:end]
+            sq = np.dot(part, part)
+        else:
+            head, tail = self.file[start : first * block], self.file[last * block : end]
+            sq = self._block_sq[last] - self._block_sq[first] + np.dot(head, head) + np.dot(tail, tail)
+        return float(np.sqrt(sq / (end - start)))
 
-
-def transcribe(segment, real_overlap):
+    def norm_data(self, start, end, all=False):
+        if self.streaming:
+            if all:
+                start, end = 0, self.duration
+            if int(start * self.sr) < self._last_start:
+                # reading backwards restarts the decoding: the gain control starts again with it
+                self.agc = AutomaticGainControl(self.sr, target_rms=self.target_rms)
+            self._last_start = int(start * self.sr)
+            data = self.decoder.read(start, end)
+            if self.normalization == "window":
+                # the decoded block stays untouched, it is shared with the next overlapping segments
+                rms = np.sqrt(np.dot(data, data) / max(len(data), 1))
+                return np.multiply(data, np.float32(self.target_rms / (rms + 1e-9)))
+            return data
+
+        if self.normalization == "window":
+            gain = self.target_rms / (self.window_rms(start, end, all) + 1e-9)
+            start, end = self._samples(start, end, all)
+            return np.multiply(self.file[start:end], np.float32(gain))
+
+        start, end = self._samples(start, end, all)
+        if start < self._norm_start:
+            # reading backwards: the gain control starts again from the beginning of the file
+            self.agc = AutomaticGainControl(self.sr, target_rms=self.target_rms)
+            self._norm_start = self._norm_end = 0
+        if end > self._norm_end:
+            # every sample goes through the gain control once and in order, samples skipped
+            # over are processed into a scratch buffer to carry its state
+            skip = max(self._norm_end, start)
+            for i in range(self._norm_end, skip, 60 * self.sr):
+                chunk = self.file[i : min(i + 60 * self.sr, skip)]
+                self.agc.process(chunk, out=np.empty(len(chunk), dtype=np.float32))
+
+            # new buffer: the previous one may still be used through a returned segment
+            lo = max(start, self._norm_start)
+            norm = np.empty(end - lo, dtype=np.float32)
+            kept = max(0, self._norm_end - lo)
+            norm[:kept] = self._norm[len(self._norm) - kept :]
+            self.agc.process(self.file[skip:end], out=norm[skip - lo :])
+            self._norm, self._norm_start, self._norm_end = norm, lo, end
+        return self._norm[start - self._norm_start : end - self._norm_start]
+
+
+def transcribe(segment, real_overlap, lang, previous=None):
+    asr = get_asr()
+    return_timestamps = {"word": "word", "segment": True, "text": False}[TIMESTAMPS]
+    if return_timestamps == "word" and not asr.word_timestamps:
+        return_timestamps = True
     with torch.no_grad():
-        result = asr(segment)
+        result = asr(segment, return_timestamps=return_timestamps, generate_kwargs={"language": lang})
 
-        chunks = result["chunks"]
+        chunks = result.get("chunks") or [{"text": result["text"], "timestamp": (0.0, None)}]
+        duration = len(segment) / 16000
+        cropped_text = crop(chunks, duration, real_overlap, duration, previous if TIMESTAMPS == "text" else None)
 
-        cropped = [c for c in chunks if c["timestamp"][0] >= real_overlap]
-        cropped_text = " ".join(c["text"].strip() for c in cropped).strip()
-        
         return cropped_text
 
 
-def translate(text, lang_target):
+def translate(text, lang_source, lang_target):
     if len(text) < 4:
         return ""
 
-    inputs = tokenizer(text, return_tensors="pt").to(DEVICE)
+    model, tokenizer = get_translation_model(), get_tokenizer()
+    # the tokenizer is shared: M2M100's source language prefix is added here instead of setting
+    # `tokenizer.src_lang`, which would change it for the other sessions
+    ids = tokenizer(text, add_special_tokens=False).input_ids
+    input_ids = torch.tensor([[tokenizer.get_lang_id(lang_source), *ids, tokenizer.eos_token_id]], device=DEVICE)
     with torch.no_grad():
         outputs = model.generate(
-            **inputs,
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
             forced_bos_token_id=tokenizer.get_lang_id(lang_target),
             max_length=256,
             num_beams=5,
@@ -81,7 +211,7 @@ if __name__ == '__main__':
     from tqdm import tqdm
 
 
-    load_models('fr')
+    load_models()
     main_color = "#1845a5"
 
     all_times = [] 
@@ -92,7 +222,7 @@ if __name__ == '__main__':
         for i in tqdm(range(50)):
             start = time.time()
             segment = preprocessed.norm_data(0, 6)
-            transc = transcribe(segment, 0)
+            transc = transcribe(segment, 0, 'fr')
             times.append(time.time() - start)
             torch.cuda.empty_cache()
         all_times.append(times)
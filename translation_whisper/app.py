@@ -7,12 +7,16 @@ from streamlit_webrtc import webrtc_streamer, WebRtcMode
 import torch
 
 from utils.lang_list import LANGUAGE_CODES
-from utils.display import update_boxes
-from utils.parameters import SR, STEP, OVERLAP_FUTURE, OVERLAP_PAST
+from utils.display import update_boxes, update_transcript, update_translation
+from utils.parameters import SR, STEP, OVERLAP_FUTURE, OVERLAP_PAST, ASR_MODE, FEATURE_CACHE, ASR_MODEL, ASR_LEVELS, ADAPTIVE_ASR
+from utils.log_mel import StreamingLogMel, HOP
+from utils.rtf_controller import RTFController
 from utils.logs.logs import log_memory, TIME
 from utils.logs.save_graph_durations import save_durations_plot
-from translation import translate, transcribe, load_models
-from audio_processor import AudioProcessor, normalize_buffer
+from translation import translate, transcribe, transcribe_words, load_models, preload_asr
+from audio_processor import AudioProcessor
+from streaming_asr import StreamingTranscriber
+from translation_stage import TranslationStage
 
 
 st.set_page_config(layout="wide")
@@ -42,9 +46,19 @@ col_load, col_play = st.columns([1, 2])
 with col_load:
     if st.button("Load models for selected languages"):
         with st.spinner("Loading models..."):
-            st.session_state.models_info = load_models(LANG_AUDIO)
+            st.session_state.models_info, startup = load_models(LANG_AUDIO)
             st.session_state.models_loaded = True
         st.success("Models loaded for: " + lang_audio + " to " + lang_subtitles)
+        st.caption(" | ".join(
+            f"{key.model_id}: loaded in {info['load_s']:.1f}s, {info['bytes'] / 2**20:.0f} MB, used {info['uses']}x"
+            for key, info in st.session_state.models_info.items()
+        ))
+        st.caption(
+            f"Startup {startup['load_s'] + startup['warm_up_s']:.1f}s (loading {startup['load_s']:.1f}s, "
+            f"warm-up {startup['warm_up_s']:.1f}s) | " + " | ".join(
+                f"{name}: first {first:.2f}s, then {steady:.2f}s" for name, (first, steady) in startup["warm_up"].items()
+            )
+        )
 
 #------- select device -------#
 ctx = webrtc_streamer(
@@ -72,67 +86,129 @@ if ctx and ctx.audio_processor:
 
     durations_transc = []
     durations_transl = []
-
-    while ctx.state.playing:
-        if time.time() - prev_step < STEP:
-            time.sleep(0.1)
-            continue
-        prev_step = time.time()
-
-        buffer = ctx.audio_processor.pop_buffer()
-        if len(buffer) == 0:
-            time.sleep(0.1)
-            if generated_last:
-                segment = normalize_buffer(buffer, target_mean=0.1)
+    # smaller checkpoint / fewer beams when the steps take longer than the audio they cover
+    controller = RTFController(ASR_LEVELS if ADAPTIVE_ASR else [(ASR_MODEL, 1)], budget=STEP)
+    transcriber = None
+    if ASR_MODE == "streaming":
+        transcriber = StreamingTranscriber(lambda segment, prompt: transcribe_words(segment, LANG_AUDIO, prompt, level=controller.level))
+    log_mel = StreamingLogMel() if FEATURE_CACHE else None
+    # window n is translated on another thread while window n+1 is transcribed
+    translator = TranslationStage(translate, LANG_AUDIO, LANG_SUBTITLES)
+
+    try:
+        while ctx.state.playing:
+            for _, transl, duration_transl in translator.results():
+                durations_transl.append(duration_transl)
+                update_translation(transl_box, prev_transl, transl)
+                prev_transl = transl
+
+            if time.time() - prev_step < STEP:
+                time.sleep(0.1)
+                continue
+            prev_step = time.time()
+
+            buffer = ctx.audio_processor.pop_buffer()
+
+            if transcriber is not None:
+                duration_transc = time.time()
+                transc = ""
+                if len(buffer) > 0:
+                    transcriber.insert_audio(buffer)
+                    transc = transcriber.process()
+                if len(buffer) == 0 or ctx.audio_processor.utterance_ended():
+                    # end of speech: no later step will confirm the pending words
+                    transc = " ".join(t for t in (transc, transcriber.finish()) if t)
+                duration_transc = time.time() - duration_transc
+
+                if not transc:
+                    time.sleep(0.1)
+                    continue
+
+                update_transcript(transc_box, prev_transc, transc)
+                wait = translator.put(transc)
+
+                durations_transc.append(duration_transc)
+                # the step is late when the ASR is slow or when the translation queue is full
+                controller.update(duration_transc + wait)
+                if controller.needs_standby:
+                    preload_asr(controller.standby[0], LANG_AUDIO)
+                prev_transc = transc
+                continue
+
+            if len(buffer) == 0:
+                time.sleep(0.1)
+                if generated_last and prev_buffer is not None:
+                    # end of speech: transcribe the end of the last window, kept for the next step
+                    segment = prev_buffer
+
+                    start_subt = max(0, (1 - OVERLAP_FUTURE) * len(segment))
+                    transc = transcribe(segment, start_subt / SR, len(segment) / SR, LANG_AUDIO, level=controller.level, previous=prev_transc)
+                    update_transcript(transc_box, prev_transc, transc)
+                    translator.put(transc)
+                    prev_transc = transc
+
+                generated_last = False
+                prev_buffer = None
+                continue
+
+            log_memory()
+            generated_last = True
+            duration_transc = time.time()
+
+            if prev_buffer is None or len(prev_buffer) == 0:
+                segment = buffer
+                start_subt, end_subt = 0, (1 - OVERLAP_FUTURE) * len(buffer)
+                last_step = len(buffer)
+                if log_mel is not None:
+                    log_mel.reset()  # the stream restarts with the speech
+            else:
+                segment = np.concatenate([prev_buffer, buffer])
                 curr_step = len(segment) // 2
-
-                start_subt = max(0, (1 - OVERLAP_FUTURE) * len(segment))
-                transc = transcribe(segment, start_subt / SR, len(segment) / SR)
-                transl = translate(transc, LANG_SUBTITLES)
-                update_boxes(transc_box, transl_box, prev_transc, transc, prev_transl, transl)
-
-            generated_last = False
-            prev_buffer = None
-            continue
-
-        log_memory()
-        generated_last = True
-        duration_transc = time.time()
-
-        if prev_buffer is None or len(prev_buffer) == 0:
-            segment = normalize_buffer(buffer, target_mean=0.1)
-            transc = transcribe(segment, 0, ((1 - OVERLAP_FUTURE) * len(buffer)) / SR)
-            last_step = len(buffer)
-        else:
-            segment = np.concatenate([prev_buffer, buffer])
-            segment = normalize_buffer(segment, target_mean=0.1)
-            curr_step = len(segment) // 2
-            segment = segment[(1 - OVERLAP_PAST) * curr_step :]
-
-            start_subt = max(0, OVERLAP_PAST * curr_step - OVERLAP_FUTURE * last_step)
-            end_subt = (2 - OVERLAP_FUTURE) * curr_step
-            transc = transcribe(segment, start_subt / SR, end_subt / SR)
-            last_step = curr_step
-
-        duration_transc = time.time() - duration_transc
-
-        duration_transl = time.time()
-        transl = translate(transc, LANG_SUBTITLES)
-        duration_transl = time.time() - duration_transl
-
-        durations_transc.append(duration_transc)
+                segment = segment[(1 - OVERLAP_PAST) * curr_step :]
+
+                start_subt = max(0, OVERLAP_PAST * curr_step - OVERLAP_FUTURE * last_step)
+                end_subt = (2 - OVERLAP_FUTURE) * curr_step
+                last_step = curr_step
+
+            features = None
+            if log_mel is not None:
+                # the window starts on the frame grid, up to 10 ms earlier than the segment
+                log_mel.append(buffer)
+                window_start = (log_mel.n_samples - len(segment)) // HOP * HOP
+                shift = log_mel.n_samples - len(segment) - window_start
+                features = log_mel.features(window_start, log_mel.n_samples)
+                start_subt, end_subt = start_subt + shift, end_subt + shift
+            previous = prev_transc if prev_buffer is not None else None  # same speech as the last window
+            transc = transcribe(segment, start_subt / SR, end_subt / SR, LANG_AUDIO, features=features, level=controller.level, previous=previous)
+
+            duration_transc = time.time() - duration_transc
+
+            update_transcript(transc_box, prev_transc, transc)
+            wait = translator.put(transc)
+
+            durations_transc.append(duration_transc)
+            # the step is late when the ASR is slow or when the translation queue is full
+            controller.update(duration_transc + wait)
+            if controller.needs_standby:
+                preload_asr(controller.standby[0], LANG_AUDIO)
+
+            prev_transc = transc
+            prev_buffer = buffer
+
+            log_memory()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            log_memory()
+    except BaseException:
+        # a rerun or stop raises out of the loop: drop the queued windows, no thread left waiting
+        translator.close(drain=False)
+        raise
+    translator.close()
+
+    for _, transl, duration_transl in translator.results():
         durations_transl.append(duration_transl)
-
-        update_boxes(transc_box, transl_box, prev_transc, transc, prev_transl, transl)
-
-        prev_transc = transc
+        update_translation(transl_box, prev_transl, transl)
         prev_transl = transl
-        prev_buffer = buffer
-
-        log_memory()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-        log_memory()
 
     save_durations_plot(durations_transc, durations_transl, f"durations_log_{TIME}")
 
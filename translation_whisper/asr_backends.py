@@ -0,0 +1,118 @@
+import os
+
+import torch
+from transformers import pipeline, AutoProcessor
+
+
+class ASRBackend:
+    """Whisper engine behind `transcribe`, wrapping a transformers ASR pipeline.
+
+    Calling the backend on 16 kHz audio returns the pipeline output (`text` and timestamped
+    `chunks`). `word_timestamps` tells whether the chunks are words or whole segments.
+    """
+
+    name = None
+    word_timestamps = True
+
+    @property
+    def model(self):
+        return self.pipe.model
+
+    @property
+    def device(self):
+        return self.pipe.device
+
+    def __call__(self, audio, **kwargs):
+        return self.pipe(audio, **kwargs)
+
+    def features(self, audio):
+        """Input features [n_mels, 3000] and attention mask [3000] of 16 kHz `audio`."""
+        inputs = self.pipe.feature_extractor(
+            audio, sampling_rate=self.pipe.feature_extractor.sampling_rate, return_tensors="np", return_attention_mask=True
+        )
+        return inputs.input_features[0], inputs.attention_mask[0]
+
+    def from_features(self, features, mask, **kwargs):
+        """Runs the pipeline on precomputed input features and attention mask (see utils.log_mel)."""
+        return self.from_features_batch(features[None], mask[None], **kwargs)[0]
+
+    def from_features_batch(self, features, masks, **kwargs):
+        """Runs the pipeline once on a batch of features [batch, n_mels, frames] and masks [batch, frames].
+
+        Returns one pipeline output per item, the batch is decoded by a single `generate`.
+        """
+        _, forward_params, postprocess_params = self.pipe._sanitize_parameters(**kwargs)
+        model_inputs = {
+            "is_last": True,
+            "input_features": torch.from_numpy(features),
+            "attention_mask": torch.from_numpy(masks),
+        }
+        dtype = getattr(self.pipe, "dtype", None)
+        if dtype is not None:
+            model_inputs["input_features"] = model_inputs["input_features"].to(dtype)
+
+        outputs = self.pipe.forward(model_inputs, **{**self.pipe._forward_params, **forward_params})
+        results = []
+        for i in range(len(features)):
+            # the pipeline's own unbatching: tensors and lists sliced along the batch
+            item = {k: v[i : i + 1] if isinstance(v, (torch.Tensor, list)) else v for k, v in outputs.items()}
+            results.append(self.pipe.postprocess([item], **{**self.pipe._postprocess_params, **postprocess_params}))
+        return results
+
+    def prompt_ids(self, prompt):
+        return torch.tensor(self.pipe.tokenizer.get_prompt_ids(prompt), device=self.device)
+
+
+class PipelineBackend(ASRBackend):
+    """PyTorch Whisper through the transformers pipeline, with word timestamps."""
+
+    name = "hf"
+
+    def __init__(self, model, device="cpu", dtype=torch.float32):
+        self.pipe = pipeline(
+            "automatic-speech-recognition",
+            model=model,
+            device=0 if device == "cuda" else -1,
+            dtype=dtype,
+            return_timestamps="word",
+        )
+
+
+class ORTBackend(ASRBackend):
+    """Whisper exported to ONNX and run by ONNX Runtime (optimum).
+
+    The checkpoint (hub id or local directory) is exported once to `onnx_dir` (by default an
+    `onnx` folder next to a local checkpoint), later loads only open the encoder and decoder
+    sessions. The decoder keeps its KV cache in bound buffers (IO binding) between tokens. The
+    exported decoder does not return cross-attentions, so chunks are segments, not words.
+    """
+
+    name = "ort"
+    word_timestamps = False
+
+    def __init__(self, model, device="cpu", onnx_dir=None):
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+        if onnx_dir is None:
+            if os.path.isdir(model):
+                onnx_dir = os.path.join(model, "onnx")
+            else:
+                onnx_dir = os.path.join(os.path.expanduser("~/.cache/whisper_onnx"), model.replace("/", "--"))
+        provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+
+        processor = AutoProcessor.from_pretrained(model)
+        if not os.path.exists(os.path.join(onnx_dir, "encoder_model.onnx")):
+            ORTModelForSpeechSeq2Seq.from_pretrained(model, export=True, use_cache=True).save_pretrained(onnx_dir)
+            processor.save_pretrained(onnx_dir)
+        ort_model = ORTModelForSpeechSeq2Seq.from_pretrained(onnx_dir, use_cache=True, use_io_binding=True, provider=provider)
+
+        self.pipe = pipeline(
+            "automatic-speech-recognition",
+            model=ort_model,
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor,
+            return_timestamps=True,
+        )
+
+
+BACKENDS = {backend.name: backend for backend in (PipelineBackend, ORTBackend)}
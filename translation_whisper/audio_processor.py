@@ -1,20 +1,73 @@
 import numpy as np
 import threading
-from collections import deque
+from itertools import groupby
 
 from streamlit_webrtc import AudioProcessorBase
-from scipy.signal import resample_poly
 
 from utils.parameters import SR
+from utils.resampler import StreamingResampler
+from utils.level_meter import LevelMeter
+from utils.vad import VoiceActivityDetector
+from utils.agc import AutomaticGainControl
+
+
+class RingBuffer:
+    """Fixed-capacity float32 ring buffer, the oldest samples are overwritten when full.
+
+    Not thread-safe: AudioProcessor updates it under its own lock, together with its level
+    meter and VAD.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.data = np.zeros(self.capacity, dtype=np.float32)
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, audio):
+        n = len(audio)
+        if n == 0:
+            return
+        if n >= self.capacity:
+            self.data[:] = audio[n - self.capacity:]
+            self.start, self.size = 0, self.capacity
+            return
+
+        end = (self.start + self.size) % self.capacity
+        first = min(n, self.capacity - end)
+        self.data[end:end + first] = audio[:first]
+        self.data[:n - first] = audio[first:]
+
+        overflow = max(0, self.size + n - self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+        self.size += n - overflow
+
+    def read(self):
+        """Returns a copy of the buffered samples, oldest first."""
+        end = self.start + self.size
+        if end <= self.capacity:
+            return self.data[self.start:end].copy()
+        return np.concatenate((self.data[self.start:], self.data[:end - self.capacity]))
+
+    def clear(self):
+        self.start, self.size = 0, 0
 
 
 class AudioProcessor(AudioProcessorBase):
     def __init__(self):
-        self.buffer = deque()
-        self.lock = threading.Lock()
         self.sr = SR
         self.max_samples = self.sr * 4
+        self.buffer = RingBuffer(self.max_samples)
+        self.lock = threading.Lock()
+        self.meter = LevelMeter(self.sr, window_s=2, max_s=4)
+        self.vad = VoiceActivityDetector(self.sr)
+        self.agc = AutomaticGainControl(self.sr, target_rms=0.1)
+        self._agc_out = np.empty(0, dtype=np.float32)
         self.running = True
+        self.resamplers = {}
 
     def _to_float32(self, data: np.ndarray) -> np.ndarray:
         if np.issubdtype(data.dtype, np.integer):
@@ -25,93 +78,78 @@ class AudioProcessor(AudioProcessorBase):
         return data.astype(np.float32)
 
     def _to_mono(self, data, frames) -> np.ndarray:
-        if frames.layout.name == 'mono':
-            return data
-        if data.ndim == 2:
-            axis = 0 if data.shape[0] <= 8 else 1
-            return np.mean(data, axis=axis, dtype=np.float32)
-        if data.ndim == 1:
-            return data.reshape(-1, 2).mean(axis=1)
-        return data
+        n_channels = len(frames.layout.channels)
+        if n_channels == 1:
+            return data[0]
+        if frames.format.is_planar:
+            return np.mean(data, axis=0, dtype=np.float32)
+        return data[0].reshape(-1, n_channels).mean(axis=1, dtype=np.float32)
+
+    def _resample(self, audio, sample_rate):
+        key = (sample_rate, self.sr)
+        if key not in self.resamplers:
+            self.resamplers[key] = StreamingResampler(*key)
+        return self.resamplers[key].process(audio)
+
+    def _process_frames(self, frames):
+        """Converts, downmixes and resamples consecutive frames sharing the same format in one pass."""
+        chunks = []
+        for _, group in groupby(frames, key=lambda f: (f.sample_rate, f.format.name, f.layout.name)):
+            group = list(group)
+            audio = np.concatenate([frame.to_ndarray() for frame in group], axis=1)
+            audio_float = self._to_float32(audio)
+            audio_mono = self._to_mono(audio_float, group[0])
+            chunks.append(self._resample(audio_mono, group[0].sample_rate))
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
 
     def recv(self, frames):
-        audio = frames.to_ndarray()
-        audio_float = self._to_float32(audio[0])
-        audio_mono = self._to_mono(audio_float, frames).astype(np.float32)
-        audio_mono_16k = resample_poly(audio_mono, up=self.sr, down=frames.sample_rate)
-        self.fill_buffer(audio_mono_16k)
+        self.fill_buffer(self._process_frames([frames]))
         return frames
-    
-    """async def recv_queued(self, frames):
+
+    async def recv_queued(self, frames):
         if not frames:
             return frames
-        
-        chunks = []
-        for frame in frames:
-            arr = frame.to_ndarray()
-            audio_float = self._to_float32(arr)
-            audio_mono = self._to_mono(audio_float, frame).astype(np.float32)
-            audio_mono_16k = resample_poly(audio_mono, up=self.sr, down=frame.sample_rate)
-            chunks.append(audio_mono_16k)
-
-        if chunks:
-            segment = np.concatenate(chunks)
-            self.fill_buffer(segment)
-
-        return frames"""
+        self.fill_buffer(self._process_frames(frames))
+        return frames
 
     def fill_buffer(self, audio):
         with self.lock:
-            self.buffer.append(audio)
-            total_samples = sum(arr.size for arr in self.buffer)
-            while total_samples > self.max_samples and len(self.buffer) > 0:
-                removed = self.buffer.popleft()
-                total_samples -= removed.size
+            self.meter.update(audio)
+            self.vad.process(audio)
+
+            # the gain only adapts during speech, the buffer keeps the normalized audio
+            if len(self._agc_out) < len(audio):
+                self._agc_out = np.empty(len(audio), dtype=np.float32)
+            self.buffer.append(self.agc.process(audio, out=self._agc_out, adapt=self.vad.in_speech))
 
-    def pop_buffer(self, clear=True, db_threshold=-35):
+    def pop_buffer(self, clear=True, db_threshold=-35, use_vad=True):
         with self.lock:
-            if not self.buffer:
+            if len(self.buffer) == 0:
                 return np.zeros(0, dtype=np.float32)
-            arr = np.concatenate(list(self.buffer)).astype(np.float32)
+            level = self.meter.max_window_db
+            speech = self.vad.has_speech or not use_vad
+            arr = self.buffer.read() if level >= db_threshold and speech else None
             if clear:
                 self.buffer.clear()
+                self.meter.reset()
+                self.vad.reset()
 
         # -- logs -- #
-        level = level_from_buffer(arr)
         print(
             "\n--- AUDIO LEVEL LOG -----------------\n"
             f"  Audio max mean level: {level} dB\n"
+            f"  Noise floor: {self.meter.noise_floor_db} dB\n"
+            f"  Speech detected: {speech}\n"
             "-------------------------------------\n"
         )
-        if level < db_threshold:
+        if arr is None:
             return np.zeros(0, dtype=np.float32)
         return arr
 
-    def stop(self):
-        self.running = False
-
-
-def level_from_buffer(buffer, window_s=2):
-    win_size = window_s * SR
-    if win_size <= 0 or win_size > len(buffer):
-        win_size = len(buffer)
-
-    max_db = -200
-    for i in range(0, len(buffer) - win_size + 1, win_size // 2):
-        win = buffer[i:i + win_size]
-        sq_mean = np.nanmean(win ** 2)
-        if sq_mean <= 0 or np.isnan(sq_mean):
-            continue
-
-        rms = np.sqrt(sq_mean)
-        db = 20 * np.log10(rms + 1e-6)
-
-        if db > max_db:
-            max_db = db
-
-    return max_db
-
+    def utterance_ended(self):
+        """True once after the VAD detected the end of an utterance."""
+        with self.lock:
+            return self.vad.pop_endpoint()
 
-def normalize_buffer(buffer, target_mean=0.1):
-    rms = np.sqrt(np.mean(buffer**2))
-    return buffer * (target_mean / (rms + 1e-9))
\ No newline at end of file
+    def stop(self):
+        self.running = False
\ No newline at end of file
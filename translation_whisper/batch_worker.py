@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchWorker:
+    """One inference thread for all sessions, running the requests that arrive together as a batch.
+
+    `submit(key, item)` queues a request and returns a Future. The worker takes the first waiting
+    request, collects whatever else arrives within `max_wait_s` (up to `max_batch` requests), and
+    calls `run_batch(key, items)` once per key among them, which returns one result per item.
+    Only requests with the same key are batched together (same model and generation settings),
+    and each result (or the batch's exception) is set on the Future of its request.
+    """
+
+    def __init__(self, run_batch, max_batch=8, max_wait_s=0.005):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.batch_sizes = []  # size of each batch run, for the logs
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, item):
+        future = Future()
+        self._queue.put((key, item, future))
+        return future
+
+    def __call__(self, key, item):
+        return self.submit(key, item).result()
+
+    def _collect(self):
+        requests = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(requests) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                requests.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return requests
+
+    def _run(self):
+        while True:
+            groups = {}
+            for key, item, future in self._collect():
+                if future.set_running_or_notify_cancel():
+                    groups.setdefault(key, []).append((item, future))
+
+            for key, requests in groups.items():
+                self.batch_sizes.append(len(requests))
+                try:
+                    results = self.run_batch(key, [item for item, _ in requests])
+                except Exception as e:
+                    for _, future in requests:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(requests, results):
+                    future.set_result(result)
+
+
+if __name__ == "__main__":
+    import torch
+    from transformers import WhisperConfig, WhisperForConditionalGeneration
+
+    from utils.parameters import STEP
+
+    # 8 sessions sending a window each STEP, served one call at a time or batched by the worker.
+    # whisper-base dimensions with random weights, a fixed number of tokens per window
+    config = WhisperConfig(
+        d_model=512, encoder_layers=6, encoder_attention_heads=8, encoder_ffn_dim=2048,
+        decoder_layers=6, decoder_attention_heads=8, decoder_ffn_dim=2048, num_mel_bins=80,
+    )
+    model = WhisperForConditionalGeneration(config).eval()
+    generation_config = model.generation_config
+    generation_config.decoder_start_token_id = config.decoder_start_token_id
+    generation_config.eos_token_id = generation_config.pad_token_id = config.eos_token_id
+    n_sessions, n_tokens = 8, 20
+
+    def run_batch(key, items):
+        with torch.no_grad():
+            tokens = model.generate(input_features=torch.stack(items), max_new_tokens=n_tokens, min_new_tokens=n_tokens)
+        return list(tokens)
+
+    windows = [torch.randn(config.num_mel_bins, 3000) for _ in range(n_sessions)]
+    run_batch(None, windows[:1])  # warm-up
+
+    for max_batch in (1, n_sessions):
+        worker = BatchWorker(run_batch, max_batch=max_batch)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(None, w)) for w in windows]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        print(f"max batch {max_batch} | {n_sessions} sessions served in {elapsed:.2f}s (step {STEP}s)"
+              f" | batches {worker.batch_sizes}")
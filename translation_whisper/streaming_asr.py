@@ -0,0 +1,129 @@
+import re
+
+import numpy as np
+
+from utils.parameters import SR
+
+
+def _norm(word):
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+class StreamingTranscriber:
+    """Incremental transcription of a growing audio window, committing words by local agreement.
+
+    Each step decodes the window (audio since the last trim) with the committed text that was
+    trimmed out of it as prompt. A word is committed once two consecutive hypotheses agree on it,
+    and only the uncommitted tail of the hypothesis is replaced from one step to the next. The
+    window is trimmed after the last committed sentence once longer than `trim_s`, and after the
+    last committed word once longer than `max_s`, so a step only pays for the new audio and the
+    uncommitted tail instead of re-decoding overlapping windows. Past `max_s`, the pending words
+    are committed without agreement, and a window still too long is cut to its last `trim_s`
+    seconds, so it always fits Whisper's 30 s input.
+
+    `transcribe_words(audio, prompt)` returns the words of `audio` as (start, end, text), in
+    seconds from the start of `audio`.
+    """
+
+    def __init__(self, transcribe_words, sr=SR, trim_s=15, max_s=25, prompt_chars=200):
+        self.transcribe_words = transcribe_words
+        self.sr = sr
+        self.trim_s = trim_s
+        self.max_s = max_s
+        self.prompt_chars = prompt_chars
+        self.reset()
+
+    def reset(self):
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.offset = 0.0  # time of audio[0], in seconds since the start
+        self.committed = []  # committed words still inside the window, (start, end, text) in absolute time
+        self.hypothesis = []  # uncommitted words of the last step
+        self.prompt = ""  # committed text trimmed out of the window
+
+    @property
+    def committed_end(self):
+        return self.committed[-1][1] if self.committed else self.offset
+
+    @property
+    def pending_text(self):
+        return " ".join(w[2] for w in self.hypothesis)
+
+    def insert_audio(self, audio):
+        self.audio = np.concatenate((self.audio, np.asarray(audio, dtype=np.float32)))
+
+    def process(self):
+        """Decodes the window and returns the text committed by this step."""
+        if len(self.audio) == 0:
+            return ""
+        words = [
+            (self.offset + start, self.offset + end, text)
+            for start, end, text in self.transcribe_words(self.audio, self.prompt)
+            if text
+        ]
+        new = self._new_words(words)
+
+        # longest common prefix of the last two hypotheses
+        n = 0
+        while n < min(len(new), len(self.hypothesis)) and _norm(new[n][2]) == _norm(self.hypothesis[n][2]):
+            n += 1
+        commit, self.hypothesis = new[:n], new[n:]
+        self.committed.extend(commit)
+
+        commit += self._trim()
+        return " ".join(w[2] for w in commit)
+
+    def finish(self):
+        """Commits the pending hypothesis (e.g. at the end of an utterance) and starts a new window."""
+        text = self.pending_text
+        self.committed.extend(self.hypothesis)
+        self.hypothesis = []
+        self._trim_at(self.offset + self.duration)
+        return text
+
+    def _new_words(self, words):
+        # words of the committed part of the window are transcribed again: keep what starts after it
+        words = [w for w in words if w[0] >= self.committed_end - 0.1]
+
+        # and drop a repetition of the last committed words (timestamps are not exact)
+        committed = [_norm(w[2]) for w in self.committed]
+        for k in range(min(5, len(committed), len(words)), 0, -1):
+            if committed[-k:] == [_norm(w[2]) for w in words[:k]]:
+                return words[k:]
+        return words
+
+    @property
+    def duration(self):
+        return len(self.audio) / self.sr
+
+    def _trim(self):
+        """Trims the window, returns the pending words committed to keep it under `max_s`."""
+        forced = []
+        if self.duration > self.max_s:
+            # no agreement for too long: commit the hypothesis rather than let the window grow
+            forced, self.hypothesis = self.hypothesis, []
+            self.committed.extend(forced)
+        if self.duration <= self.trim_s:
+            return forced
+
+        sentence_ends = [w[1] for w in self.committed if w[2].endswith((".", "?", "!"))]
+        if sentence_ends:
+            self._trim_at(sentence_ends[-1])
+        if self.duration > self.max_s and self.committed:
+            self._trim_at(self.committed[-1][1])
+        if self.duration > self.max_s:
+            # no words late in the window (e.g. noise): keep its last `trim_s` seconds
+            self._trim_at(self.offset + self.duration - self.trim_s)
+        return forced
+
+    def _trim_at(self, t):
+        """Removes the audio before `t` and moves the committed words before it to the prompt."""
+        cut = min(max(0, int(round((t - self.offset) * self.sr))), len(self.audio))
+        self.audio = self.audio[cut:]
+        self.offset += cut / self.sr
+
+        # with the whole window trimmed, every committed word goes to the prompt
+        kept = [w for w in self.committed if w[1] > self.offset] if len(self.audio) else []
+        trimmed = [w[2] for w in self.committed[: len(self.committed) - len(kept)]]
+        self.committed = kept
+        if trimmed:
+            self.prompt = (self.prompt + " " + " ".join(trimmed)).strip()[-self.prompt_chars:]
@@ -1,49 +1,197 @@
+import threading
+import time
+
+import numpy as np
 import torch
-from transformers import pipeline, M2M100Tokenizer, M2M100ForConditionalGeneration
+from transformers import M2M100Tokenizer, M2M100ForConditionalGeneration
 
-from utils.parameters import SR
+from utils.parameters import SR, STEP, TRIMMED_ENCODER, ASR_PRECISION, ASR_BACKEND, ASR_MODEL, TIMESTAMPS, BATCH_SIZE, BATCH_WAIT_MS
+from utils.parameters import ASR_MODE, FEATURE_CACHE, WARM_UP, COMPILE, COMPILE_CACHE_DIR
+from utils.quantization import resolve_precision, quantize_int8
+from utils.whisper_encoder import enable_trimmed_encoder, trim_features
+from utils.model_registry import registry, ModelKey
+from utils.alignment import crop
+from utils.log_mel import StreamingLogMel
+from utils.warmup import enable_compile_cache, compile_model, synthetic_speech
+from asr_backends import BACKENDS
+from batch_worker import BatchWorker
 
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DTYPE = torch.float16 if torch.cuda.is_available() else torch.float32
+PRECISION = resolve_precision(ASR_PRECISION) if ASR_BACKEND == "hf" else "fp32"
+ASR_DEVICE = "cpu" if PRECISION == "int8" else DEVICE  # quantized layers only run on CPU
 model_name = "facebook/m2m100_418M"
-model = M2M100ForConditionalGeneration.from_pretrained(model_name).to(DEVICE)
-model.eval()
-model.half()
 
-asr, tokenizer = None, None
+_warmed = set()  # models already warmed up in this process
+_preloaded = set()  # models already loaded in the background
+
+if COMPILE:
+    enable_compile_cache(COMPILE_CACHE_DIR)
+
+
+def _load_asr(model=ASR_MODEL):
+    if ASR_BACKEND != "hf":
+        return BACKENDS[ASR_BACKEND](model, device=ASR_DEVICE)
+
+    asr = BACKENDS["hf"](model, device=ASR_DEVICE, dtype=torch.float16 if PRECISION == "fp16" else torch.float32)
+    if PRECISION == "int8":
+        quantize_int8(asr.model)
+    if TRIMMED_ENCODER:
+        enable_trimmed_encoder(asr.model)
+    if COMPILE and PRECISION != "int8":
+        compile_model(asr.model)
+    return asr
+
+
+def _load_translation_model():
+    model = M2M100ForConditionalGeneration.from_pretrained(model_name).to(DEVICE)
+    model.eval()
+    model = model.half() if DEVICE == "cuda" else model
+    return compile_model(model) if COMPILE else model
+
+
+def get_asr(model=ASR_MODEL):
+    # one pipeline for all languages, the language is given to each call
+    return registry.get(ModelKey(f"{model} ({ASR_BACKEND})", ASR_DEVICE, PRECISION, None), lambda: _load_asr(model))
+
+
+def _preload_asr(model, lang):
+    get_asr(model)
+    if WARM_UP:
+        warm_up_asr(model, lang)
 
 
-def load_models(lang_src):
-    global asr
-    global tokenizer
+def preload_asr(model, lang):
+    """Loads (and warms up in `lang`) `model` in the background, a later `get_asr(model)` waits for this load."""
+    if model in _preloaded:
+        return
+    _preloaded.add(model)
+    threading.Thread(target=_preload_asr, args=(model, lang), daemon=True).start()
 
-    # transcription
-    asr = pipeline(
-        "automatic-speech-recognition",
-        model="openai/whisper-medium",
-        device=0 if torch.cuda.is_available() else -1,
-        dtype=torch.float16 if torch.cuda.is_available() else None,
-        return_timestamps="word",
-        language=lang_src,
-    )
 
-    # translation
-    tokenizer = M2M100Tokenizer.from_pretrained(model_name)
-    tokenizer.src_lang = lang_src
+def get_translation_model():
+    return registry.get(ModelKey(model_name, DEVICE, str(DTYPE), None), _load_translation_model)
 
 
-def transcribe(segment, start, end):
+def get_tokenizer():
+    return registry.get(ModelKey(model_name + ":tokenizer", "cpu", None, None), lambda: M2M100Tokenizer.from_pretrained(model_name))
+
+
+def _run_batch(key, items):
+    """Decodes the (features, mask) `items` of all sessions sharing `key` in one batch."""
+    model, language, num_beams, return_timestamps, prompt = key
+    asr = get_asr(model)
+    generate_kwargs = {"language": language, "num_beams": num_beams}
+    if prompt:
+        generate_kwargs["prompt_ids"] = asr.prompt_ids(prompt)
+
+    # trimmed features have different lengths, pad them with silence (their minimum)
+    n_frames = max(features.shape[-1] for features, _ in items)
+    features = np.stack([np.pad(f, ((0, 0), (0, n_frames - f.shape[-1])), constant_values=f.min()) for f, _ in items])
+    masks = np.stack([np.pad(m, (0, n_frames - len(m))) for _, m in items])
+    with torch.no_grad():
+        return asr.from_features_batch(features, masks, return_timestamps=return_timestamps, generate_kwargs=generate_kwargs)
+
+
+# one inference thread shared by the sessions, batching the windows sent within BATCH_WAIT_MS
+asr_worker = BatchWorker(_run_batch, max_batch=BATCH_SIZE, max_wait_s=BATCH_WAIT_MS / 1000) if BATCH_SIZE > 1 else None
+
+
+def load_models(lang):
+    """Loads the models once per process, shared by all sessions and languages.
+
+    `lang` is only the source language of the warm-up passes, each session gives its own language
+    to `transcribe` and `translate`. Returns the registry stats and the startup timings: loading, then warm-up passes as
+    {pass: [first, second] durations}, the second one being the steady-state latency.
+    """
+    start = time.time()
+    model = ASR_MODEL
+    get_asr(model)
+    get_translation_model()
+    get_tokenizer()
+    load_s = time.time() - start
+
+    warm_up = {}
+    if WARM_UP:
+        warm_up = {**warm_up_asr(model, lang), **warm_up_translation(lang)}
+    startup = {"load_s": load_s, "warm_up_s": time.time() - start - load_s, "warm_up": warm_up}
+    print(f"[startup] models loaded in {load_s:.1f}s, warmed up in {startup['warm_up_s']:.1f}s")
+    return registry.stats(), startup
+
+
+def _twice(fn):
+    durations = []
+    for _ in range(2):
+        start = time.time()
+        fn()
+        durations.append(time.time() - start)
+    return durations
+
+
+def warm_up_asr(model, lang):
+    """Transcribes synthetic windows of the app's sizes (STEP, then previous + current STEP) twice.
+
+    The first pass pays for kernel selection, allocator growth and compilation (COMPILE), so the
+    first real window runs at the steady-state latency. Each model is warmed up once per process.
+    """
+    if (model, "asr") in _warmed:
+        return {}
+    durations = {}
+    for window_s in (STEP, 2 * STEP):
+        audio = synthetic_speech(window_s * SR, SR)
+        if ASR_MODE == "streaming":
+            durations[f"asr {window_s}s"] = _twice(lambda: transcribe_words(audio, lang, level=(model, 1)))
+            continue
+        features = None
+        if FEATURE_CACHE:
+            log_mel = StreamingLogMel()
+            log_mel.append(audio)
+            features = log_mel.features(0, len(audio))
+        durations[f"asr {window_s}s"] = _twice(lambda: transcribe(audio, 0, window_s, lang, features=features, level=(model, 1)))
+    _warmed.add((model, "asr"))
+    return durations
+
+
+def warm_up_translation(lang_source, lang_target="en"):
+    if (model_name, "mt") in _warmed:
+        return {}
+    text = "This sentence is only translated to warm up the translation model before the first subtitle."
+    durations = {"mt": _twice(lambda: translate(text, lang_source, lang_target))}
+    _warmed.add((model_name, "mt"))
+    return durations
+
+
+def transcribe(segment, start, end, lang, features=None, level=(ASR_MODEL, 1), previous=None):
+    """Text of `segment` (spoken in `lang`) between `start` and `end` (seconds), cropped at the TIMESTAMPS level.
+
+    `level` is the (model, num_beams) of the ASR, see utils.rtf_controller. `previous` is the text
+    emitted for the previous overlapping window, used to find the start in the "text" mode.
+    """
 
     if len(segment) < SR//10 or end <= start:
         return "..."
 
+    model, num_beams = level
+    asr = get_asr(model)
+    generate_kwargs = {"language": lang, "num_beams": num_beams}
+    # "word": DTW on the cross-attentions, "segment": timestamp tokens, "text": no timestamps
+    return_timestamps = {"word": "word", "segment": True, "text": False}[TIMESTAMPS]
+    if return_timestamps == "word" and not asr.word_timestamps:
+        return_timestamps = True
+    if features is not None and TRIMMED_ENCODER and asr.name == "hf":
+        features = trim_features(*features)
     with torch.no_grad():
-        result = asr(segment)
-
-        chunks = result["chunks"]
+        if asr_worker is not None:
+            key = (model, lang, num_beams, return_timestamps, "")
+            result = asr_worker(key, features if features is not None else asr.features(segment))
+        elif features is None:
+            result = asr(segment, return_timestamps=return_timestamps, generate_kwargs=generate_kwargs)
+        else:
+            result = asr.from_features(*features, return_timestamps=return_timestamps, generate_kwargs=generate_kwargs)
 
-        cropped = [c for c in chunks if c["timestamp"][0] >= start and end >= c["timestamp"][0]]
-        cropped_text = " ".join(c["text"].strip() for c in cropped).strip()
+        chunks = result.get("chunks") or [{"text": result["text"], "timestamp": (0.0, None)}]
+        cropped_text = crop(chunks, len(segment) / SR, start, end, previous if TIMESTAMPS == "text" else None)
 
         # -- logs -- #
         print(
@@ -55,21 +203,50 @@ def transcribe(segment, start, end):
 
         del result
         del chunks
-        del cropped
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
 
         return cropped_text
 
 
-def translate(text, lang_target):
+def transcribe_words(segment, lang, prompt="", level=(ASR_MODEL, 1)):
+    """Words of `segment` (spoken in `lang`) as (start, end, text) in seconds, decoded after `prompt` (previous text)."""
+    if len(segment) < SR//10:
+        return []
+
+    model, num_beams = level
+    asr = get_asr(model)
+    generate_kwargs = {"language": lang, "num_beams": num_beams}
+    if prompt:
+        generate_kwargs["prompt_ids"] = asr.prompt_ids(prompt)
+
+    with torch.no_grad():
+        if asr_worker is not None:
+            key = (model, lang, num_beams, "word" if asr.word_timestamps else True, prompt)
+            result = asr_worker(key, asr.features(segment))
+        else:
+            result = asr(segment, generate_kwargs=generate_kwargs)
+
+    words = []
+    for c in result["chunks"]:
+        start, end = c["timestamp"]
+        words.append((start, start if end is None else end, c["text"].strip()))
+    return words
+
+
+def translate(text, lang_source, lang_target):
     if len(text) < 4:
         return "..."
 
-    inputs = tokenizer(text, return_tensors="pt").to(DEVICE)
+    model, tokenizer = get_translation_model(), get_tokenizer()
+    # the tokenizer is shared: M2M100's source language prefix is added here instead of setting
+    # `tokenizer.src_lang`, which would change it for the other sessions
+    ids = tokenizer(text, add_special_tokens=False).input_ids
+    input_ids = torch.tensor([[tokenizer.get_lang_id(lang_source), *ids, tokenizer.eos_token_id]], device=DEVICE)
     with torch.no_grad():
         outputs = model.generate(
-            **inputs,
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
             forced_bos_token_id=tokenizer.get_lang_id(lang_target),
             max_length=256,
             num_beams=5,
@@ -0,0 +1,65 @@
+import queue
+import threading
+import time
+
+
+class TranslationStage:
+    """Translation on its own thread, so window n is translated while window n+1 is transcribed.
+
+    `put(text)` queues a transcript, waiting while `maxsize` transcripts are already queued (the
+    ASR never runs more than that ahead of the translation). `results()` returns the translations
+    done since the last call, as (transcript, translation, duration) in order, without waiting.
+    Streamlit elements are only updated by the script thread, which reads these results.
+    """
+
+    _STOP = object()
+
+    def __init__(self, translate, lang_source, lang_target, maxsize=2):
+        self.translate = translate
+        self.lang_source = lang_source
+        self.lang_target = lang_target
+        self._inputs = queue.Queue(maxsize=maxsize)
+        self._outputs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, text):
+        """Queues `text`, returns the time spent waiting for room in the queue (s)."""
+        start = time.time()
+        self._inputs.put(text)
+        return time.time() - start
+
+    def results(self):
+        results = []
+        while True:
+            try:
+                results.append(self._outputs.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self, drain=True):
+        """Stops the thread, after translating what is still queued unless `drain` is False.
+
+        Without draining, only the translation in progress (if any) is waited for.
+        """
+        if not drain:
+            while True:
+                try:
+                    self._inputs.get_nowait()
+                except queue.Empty:
+                    break
+        self._inputs.put(self._STOP)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            text = self._inputs.get()
+            if text is self._STOP:
+                return
+            start = time.time()
+            try:
+                translation = self.translate(text, self.lang_source, self.lang_target)
+            except Exception as e:
+                print(f"[translation] failed on {text!r}: {e}")
+                translation = "..."
+            self._outputs.put((text, translation, time.time() - start))
@@ -0,0 +1,164 @@
+import numpy as np
+from scipy.signal import lfilter
+
+
+class AutomaticGainControl:
+    """Streaming gain control bringing the audio RMS towards `target_rms`.
+
+    The mean square is measured per block and smoothed with exponential moving averages, the
+    level being the larger of a fast one (`attack_s`, so the gain drops within a few blocks at a
+    speech onset) and a slow one (`tau_s`, so it only recovers slowly), and the gain follows the
+    loudness continuously across successive calls instead of jumping between overlapping windows. Blocks are counted from the first sample and each
+    one gets the gain of the blocks before it, so the output does not depend on how the audio
+    is split between calls. The level is only set once `init_s` of audio above `floor_rms` has
+    been seen (the gain is 1 until then), and blocks below the floor (digital silence, codec
+    priming) or calls with `adapt=False` (e.g. outside speech) leave it unchanged. The gain is
+    capped at `max_gain`.
+    """
+
+    def __init__(self, sr, target_rms=0.1, block_s=0.01, tau_s=2.0, attack_s=0.02, max_gain=50.0, init_s=0.5, floor_rms=3e-4):
+        self.block = max(1, int(block_s * sr))
+        self.alphas = np.exp(-block_s / np.array([tau_s, attack_s]))  # slow, fast
+        self.target_rms = target_rms
+        self.max_gain = max_gain
+        self.init_blocks = max(1, int(round(init_s / block_s)))
+        self.floor_ms = floor_rms**2
+        self.powers = None  # slow and fast averages
+        self._init = []  # mean squares of the first blocks above the floor
+        self._partial_sq, self._partial_n = 0.0, 0  # samples of the current block seen so far
+
+    @property
+    def power(self):
+        return None if self.powers is None else float(self.powers.max())
+
+    def _gains(self, power):
+        return np.minimum(self.target_rms / (np.sqrt(power) + 1e-9), self.max_gain)
+
+    @property
+    def gain(self):
+        if self.powers is None:
+            return 1.0
+        return float(self._gains(self.power))
+
+    def _observe_one(self, block_ms):
+        if block_ms < self.floor_ms:
+            return
+        if self.powers is None:
+            self._init.append(block_ms)
+            if len(self._init) >= self.init_blocks:
+                self.powers = np.full(2, np.mean(self._init))
+        else:
+            self.powers = self.alphas * self.powers + (1 - self.alphas) * block_ms
+
+    def _observe(self, block_ms):
+        """Updates the level with whole blocks, returns the power after each block (nan while unknown)."""
+        before = np.nan if self.powers is None else self.power
+        active = block_ms >= self.floor_ms
+        ms = block_ms[active]
+        after = np.full(len(ms), np.nan)
+
+        first = 0
+        if self.powers is None and len(ms):
+            first = min(self.init_blocks - len(self._init), len(ms))
+            self._init.extend(ms[:first].tolist())
+            if len(self._init) >= self.init_blocks:
+                self.powers = np.full(2, np.mean(self._init))
+                after[first - 1] = self.power
+        if self.powers is not None and first < len(ms):
+            averages = [
+                lfilter([1 - alpha], [1, -alpha], ms[first:], zi=[alpha * power])[0]
+                for alpha, power in zip(self.alphas, self.powers)
+            ]
+            self.powers = np.array([average[-1] for average in averages])
+            after[first:] = np.maximum(*averages)
+
+        # blocks below the floor keep the power of the last block above it
+        last = np.cumsum(active) - 1
+        return np.where(last >= 0, after[np.maximum(last, 0)] if len(after) else before, before)
+
+    def process(self, audio, out=None, adapt=True):
+        """Applies the gain to `audio`, written into `out` (in place if not given)."""
+        audio = np.asarray(audio, dtype=np.float32)
+        out = audio if out is None else out[:len(audio)]
+        n = len(audio)
+        if n == 0:
+            return out
+        if not adapt:
+            self._partial_sq, self._partial_n = 0.0, 0
+            return np.multiply(audio, np.float32(self.gain), out=out)
+
+        # end of the block started by the previous calls (a whole 10 ms WebRTC frame usually)
+        head = min(n, self.block - self._partial_n)
+        gain = self.gain
+        self._partial_sq += float(np.dot(audio[:head], audio[:head]))
+        self._partial_n += head
+        np.multiply(audio[:head], np.float32(gain), out=out[:head])
+        if self._partial_n == self.block:
+            self._observe_one(self._partial_sq / self.block)
+            self._partial_sq, self._partial_n = 0.0, 0
+        if head == n:
+            return out
+
+        rest, out_rest = audio[head:], out[head:]
+        n_full = len(rest) // self.block
+        if n_full:
+            full = rest[: n_full * self.block].reshape(n_full, self.block)
+            gains = np.empty(n_full, dtype=np.float32)
+            gains[0] = self.gain
+            powers = self._observe(np.einsum("ij,ij->i", full, full) / self.block)
+            gains[1:] = np.where(np.isnan(powers[:-1]), 1.0, self._gains(powers[:-1]))
+            np.multiply(full, gains[:, None], out=out_rest[: n_full * self.block].reshape(n_full, self.block))
+
+        tail = rest[n_full * self.block :]
+        if len(tail):
+            self._partial_sq, self._partial_n = float(np.dot(tail, tail)), len(tail)
+            np.multiply(tail, np.float32(self.gain), out=out_rest[n_full * self.block :])
+        return out
+
+
+if __name__ == "__main__":
+    import time
+
+    def normalize_buffer(buffer, target_mean=0.1):
+        rms = np.sqrt(np.mean(buffer**2))
+        return buffer * (target_mean / (rms + 1e-9))
+
+    sr, step, n_steps = 16000, 3, 200
+    rng = np.random.default_rng(0)
+    envelope = np.repeat(rng.uniform(0.01, 0.5, step * n_steps), sr).astype(np.float32)
+    audio = rng.standard_normal(len(envelope)).astype(np.float32) * envelope
+
+    # current path: every step normalizes the concatenation of the previous and current windows
+    gain_jumps = []
+    start = time.perf_counter()
+    for i in range(1, n_steps):
+        normalize_buffer(audio[(i - 1) * step * sr : (i + 1) * step * sr])
+    per_step_normalize = (time.perf_counter() - start) / (n_steps - 1)
+    for i in range(2, n_steps):
+        # gain applied to the same (overlapping) window by two consecutive steps
+        prev = audio[(i - 2) * step * sr : i * step * sr]
+        curr = audio[(i - 1) * step * sr : (i + 1) * step * sr]
+        gain_jumps.append(abs(20 * np.log10(np.sqrt(np.mean(prev**2)) / np.sqrt(np.mean(curr**2)))))
+
+    # streaming path: each 10 ms frame is processed once, as it arrives, into a reused buffer
+    frame = sr // 100
+    agc = AutomaticGainControl(sr)
+    out = np.empty(frame, dtype=np.float32)
+    start = time.perf_counter()
+    for i in range(0, len(audio), frame):
+        agc.process(audio[i : i + frame], out=out)
+    per_step_frames = (time.perf_counter() - start) / n_steps
+
+    # streaming path fed with whole steps (e.g. applied in the app loop)
+    agc = AutomaticGainControl(sr)
+    out = np.empty(step * sr, dtype=np.float32)
+    start = time.perf_counter()
+    for i in range(n_steps):
+        agc.process(audio[i * step * sr : (i + 1) * step * sr], out=out)
+    per_step_blocks = (time.perf_counter() - start) / n_steps
+
+    print(f"normalize_buffer on {2 * step}s windows: {per_step_normalize * 1e3:.3f} ms per step, 2 allocations of {2 * step}s")
+    print(f"AutomaticGainControl, 10 ms frames: {per_step_frames * 1e3:.3f} ms per {step}s step, no allocation")
+    print(f"AutomaticGainControl, {step}s blocks: {per_step_blocks * 1e3:.3f} ms per step, no allocation")
+    print(f"normalize_buffer gain change on overlapping audio between steps: mean {np.mean(gain_jumps):.1f} dB, max {np.max(gain_jumps):.1f} dB")
+    print(f"AutomaticGainControl gain change per 10 ms block: at most {20 * np.log10(1 / np.sqrt(agc.alphas[0])):.2f} dB when the input level drops")
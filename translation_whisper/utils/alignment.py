@@ -0,0 +1,132 @@
+import re
+from difflib import SequenceMatcher
+
+
+def _norm(word):
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def split_words(chunks, duration):
+    """Words of the pipeline `chunks` as (start, text), whatever their level.
+
+    Word chunks are kept as they are. The words of a segment chunk get start times spread over
+    the segment in proportion to their characters, and text without timestamps is one segment
+    over the whole window (`duration`, in seconds).
+    """
+    words = []
+    for chunk in chunks:
+        start, end = chunk["timestamp"]
+        start = 0.0 if start is None else start
+        end = duration if end is None else end
+        tokens = chunk["text"].split()
+        n_chars = sum(len(t) for t in tokens)
+        position = 0
+        for token in tokens:
+            words.append((start + (end - start) * position / max(n_chars, 1), token))
+            position += len(token)
+    return words
+
+
+def crop_words(words, start, end):
+    """Words starting in [start, end] (seconds from the window start)."""
+    return [text for t, text in words if start <= t <= end]
+
+
+def reconcile(previous, words, min_match=2):
+    """Index of the first word of `words` not already in the `previous` text.
+
+    The new hypothesis starts inside audio that was already transcribed, so the end of `previous`
+    should be found near its beginning: the cut is after the last run of at least `min_match`
+    words shared with `previous` (or one word ending `previous`). None if nothing matches.
+    """
+    if not previous:
+        return 0
+    old = [_norm(w) for w in previous.split()]
+    new = [_norm(w) for w in words]
+    cut = None
+    for block in SequenceMatcher(None, old, new, autojunk=False).get_matching_blocks():
+        if block.size >= min_match or (block.size > 0 and block.a + block.size == len(old)):
+            cut = block.b + block.size
+    return cut
+
+
+def crop(chunks, duration, start, end, previous=None):
+    """Text of the window between `start` and `end` (seconds), from chunks of any timestamp level.
+
+    With `previous` (text emitted for the previous window), the start is found by aligning the
+    hypothesis with that text rather than by time, and the time crop is the fallback.
+    """
+    words = split_words(chunks, duration)
+    if previous is None:
+        return " ".join(crop_words(words, start, end))
+
+    cut = reconcile(previous, [text for _, text in words])
+    if cut is None:
+        return " ".join(crop_words(words, start, end))
+    return " ".join(text for t, text in words[cut:] if t <= end)
+
+
+if __name__ == "__main__":
+    import glob
+    import os
+    import sys
+    import time
+
+    import av
+    import numpy as np
+    import torch
+    from transformers import pipeline
+
+    from utils.parameters import SR, STEP, OVERLAP_FUTURE
+
+    # python -m utils.alignment [model] [language], from translation_whisper
+    model_name = sys.argv[1] if len(sys.argv) > 1 else "openai/whisper-medium"
+    language = sys.argv[2] if len(sys.argv) > 2 else None
+    audios = os.path.join(os.path.dirname(__file__), "..", "..", "translation_file", "audios")
+    generate_kwargs = {"language": language} if language else {}
+    asr = pipeline("automatic-speech-recognition", model=model_name, device=0 if torch.cuda.is_available() else -1)
+
+    def load(path):
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=SR)
+        with av.open(path) as container:
+            frames = [out.to_ndarray()[0] for frame in container.decode(audio=0) for out in resampler.resample(frame)]
+        return np.concatenate(frames + [out.to_ndarray()[0] for out in resampler.resample(None)])
+
+    def errors(reference, hypothesis):
+        """Missing and extra (duplicated) words of `hypothesis` against `reference`."""
+        ref, hyp = [_norm(w) for w in reference.split()], [_norm(w) for w in hypothesis.split()]
+        missing = extra = 0
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, ref, hyp, autojunk=False).get_opcodes():
+            if tag in ("delete", "replace"):
+                missing += max(0, (i2 - i1) - (j2 - j1))
+            if tag in ("insert", "replace"):
+                extra += max(0, (j2 - j1) - (i2 - i1))
+        return missing / max(len(ref), 1), extra / max(len(ref), 1)
+
+    # the app's overlap mode: each step transcribes the previous and the new STEP and keeps the
+    # text from the end of what was emitted to 1 - OVERLAP_FUTURE of the new step
+    modes = {"word": ("word", False), "segment": (True, False), "text": (False, True)}
+    step = STEP * SR
+    for path in sorted(glob.glob(os.path.join(audios, "*"))):
+        audio = load(path)
+        reference = " ".join(asr(audio[i : i + 30 * SR], generate_kwargs=generate_kwargs)["text"].strip()
+                             for i in range(0, len(audio), 30 * SR))
+        for mode, (return_timestamps, aligned) in modes.items():
+            emitted, previous, latency = [], None, 0.0
+            for i in range(0, len(audio), step):
+                window = audio[max(0, i - step) : i + step]
+                start_subt = 0 if i == 0 else step - OVERLAP_FUTURE * step
+                end_subt = len(window) if i + step >= len(audio) else len(window) - OVERLAP_FUTURE * step
+
+                t = time.perf_counter()
+                result = asr(window, return_timestamps=return_timestamps, generate_kwargs=generate_kwargs)
+                latency += time.perf_counter() - t
+
+                chunks = result.get("chunks") or [{"text": result["text"], "timestamp": (0.0, None)}]
+                text = crop(chunks, len(window) / SR, start_subt / SR, end_subt / SR, previous if aligned else None)
+                emitted.append(text)
+                previous = text
+            missing, extra = errors(reference, " ".join(emitted))
+            n_windows = -(-len(audio) // step)
+            print(f"{os.path.basename(path)} | {mode:7} | {latency / n_windows * 1e3:.0f} ms per window"
+                  f" | missing {missing:.1%} | duplicated {extra:.1%}")
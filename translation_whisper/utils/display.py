@@ -19,4 +19,12 @@ def _display_models_output(box, transcript=True, prev_text=None, curr_text=None)
 
 def update_boxes(transc_box, transl_box, prev_transc, transc, prev_transl, transl):
     _display_models_output(transc_box, transcript=True, prev_text=prev_transc, curr_text=transc)
-    _display_models_output(transl_box, transcript=False, prev_text=prev_transl, curr_text=transl)
\ No newline at end of file
+    _display_models_output(transl_box, transcript=False, prev_text=prev_transl, curr_text=transl)
+
+
+def update_transcript(transc_box, prev_transc, transc):
+    _display_models_output(transc_box, transcript=True, prev_text=prev_transc, curr_text=transc)
+
+
+def update_translation(transl_box, prev_transl, transl):
+    _display_models_output(transl_box, transcript=False, prev_text=prev_transl, curr_text=transl)
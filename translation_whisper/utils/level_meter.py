@@ -0,0 +1,83 @@
+from collections import deque
+
+import numpy as np
+
+
+def to_db(sq_mean):
+    if sq_mean <= 0 or np.isnan(sq_mean):
+        return -200
+    return 20 * np.log10(np.sqrt(sq_mean) + 1e-6)
+
+
+class LevelMeter:
+    """Audio level kept up to date from running sums of squares as frames arrive.
+
+    `max_window_db` is the loudest of the half-overlapping `window_s` windows covering the
+    last `max_s` seconds (or the whole audio if shorter than a window), `total_db` the level
+    of everything since the last reset. `level_db` is a short-term level (EMA) and
+    `noise_floor_db` follows its minimum, rising slowly when the background gets louder.
+    """
+
+    def __init__(self, sr, window_s=2, max_s=4, ema_s=0.3, floor_rise_db_s=1.0):
+        self.sr = sr
+        self.hop = int(window_s * sr) // 2
+        self.max_hops = max(2, int(max_s * sr) // self.hop)
+        self.ema_s = ema_s
+        self.floor_rise_db_s = floor_rise_db_s
+
+        self.level_ms = 0.0
+        self.noise_floor_db = None
+        self.reset()
+
+    def reset(self):
+        """Forgets the buffered audio, the short-term level and noise floor are kept."""
+        self._hops = deque(maxlen=self.max_hops)  # sums of squares of the completed hops
+        self._hop_sq, self._hop_n = 0.0, 0
+        self._total_sq, self._total_n = 0.0, 0
+
+    def update(self, audio):
+        audio = np.asarray(audio, dtype=np.float32)
+        n = len(audio)
+        if n == 0:
+            return
+
+        # complete hops as the frames cross their boundaries
+        pos = 0
+        while pos < n:
+            take = min(self.hop - self._hop_n, n - pos)
+            part = audio[pos:pos + take]
+            self._hop_sq += float(np.dot(part, part))
+            self._hop_n += take
+            pos += take
+            if self._hop_n == self.hop:
+                self._hops.append(self._hop_sq)
+                self._hop_sq, self._hop_n = 0.0, 0
+
+        frame_sq = float(np.dot(audio, audio))
+        self._total_sq += frame_sq
+        self._total_n += n
+
+        # short-term level and noise floor
+        alpha = np.exp(-n / (self.ema_s * self.sr))
+        self.level_ms = alpha * self.level_ms + (1 - alpha) * frame_sq / n
+        frame_db = to_db(frame_sq / n)
+        if self.noise_floor_db is None:
+            self.noise_floor_db = frame_db
+        else:
+            self.noise_floor_db = min(frame_db, self.noise_floor_db + self.floor_rise_db_s * n / self.sr)
+
+    @property
+    def level_db(self):
+        return to_db(self.level_ms)
+
+    @property
+    def total_db(self):
+        return to_db(self._total_sq / self._total_n) if self._total_n else -200
+
+    @property
+    def max_window_db(self):
+        if len(self._hops) < 2:
+            return self.total_db
+        hops = list(self._hops)
+        max_sq = max(a + b for a, b in zip(hops, hops[1:]))
+        return to_db(max_sq / (2 * self.hop))
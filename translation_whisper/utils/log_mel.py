@@ -0,0 +1,157 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from transformers.audio_utils import mel_filter_bank, window_function
+
+from utils.parameters import SR
+
+
+N_FFT = 400
+HOP = 160
+N_SAMPLES = 30 * SR  # Whisper's input length, shorter windows are padded with zeros
+N_FRAMES = N_SAMPLES // HOP
+
+
+class StreamingLogMel:
+    """Whisper log-mel frames of an audio stream, computed once for each new sample.
+
+    Frames centered on the stream's hop grid are kept in a rolling buffer (the last `max_s`
+    seconds), so `features(start, end)` for a window starting on that grid only computes the
+    few frames touching its edges: the start (reflect padding) and the end (zero padding up to
+    30 s). The result matches WhisperFeatureExtractor on the same window.
+    """
+
+    def __init__(self, n_mels=80, sr=SR, max_s=40):
+        self.window = window_function(N_FFT, "hann").astype(np.float32)
+        self.mel_filters = mel_filter_bank(
+            num_frequency_bins=1 + N_FFT // 2,
+            num_mel_filters=n_mels,
+            min_frequency=0.0,
+            max_frequency=8000.0,
+            sampling_rate=sr,
+            norm="slaney",
+            mel_scale="slaney",
+        ).astype(np.float32)
+        self.max_samples = int(max_s * sr)
+        self.silence = np.log10(1e-10)  # log-mel of a frame of zeros
+        self.reset()
+
+    def reset(self):
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.audio_start = 0  # absolute index of audio[0]
+        self.frames = np.zeros((0, self.mel_filters.shape[1]), dtype=np.float32)
+        self.frames_start = 0  # absolute index of frames[0], frame k is centered on sample k * HOP
+
+    @property
+    def n_samples(self):
+        return self.audio_start + len(self.audio)
+
+    def _log_mel(self, segments):
+        """log10 mel energies of the [n, N_FFT] `segments`."""
+        spectrum = np.fft.rfft(segments * self.window, axis=-1)
+        power = spectrum.real**2 + spectrum.imag**2
+        return np.log10(np.maximum(power.astype(np.float32) @ self.mel_filters, 1e-10))
+
+    def append(self, audio):
+        self.audio = np.concatenate((self.audio, np.asarray(audio, dtype=np.float32)))
+
+        # frames whose samples are all known
+        first = self.frames_start + len(self.frames)
+        last = (self.n_samples - N_FFT // 2) // HOP + 1
+        if last > first:
+            lo = first * HOP - N_FFT // 2  # first sample of the first frame
+            hi = (last - 1) * HOP + N_FFT // 2
+            segment = self.audio[max(0, lo - self.audio_start) : hi - self.audio_start]
+            if lo < self.audio_start:
+                # beginning of the stream, these frames are always recomputed as window starts
+                segment = np.pad(segment, (self.audio_start - lo, 0))
+            windows = sliding_window_view(segment, N_FFT)[::HOP]
+            self.frames = np.concatenate((self.frames, self._log_mel(windows)))
+
+        # rolling buffers
+        drop = len(self.audio) - self.max_samples
+        if drop > 0:
+            self.audio = self.audio[drop:]
+            self.audio_start += drop
+        drop = len(self.frames) - self.max_samples // HOP
+        if drop > 0:
+            self.frames = self.frames[drop:]
+            self.frames_start += drop
+
+    def _window_samples(self, window, positions):
+        """Samples of the zero-padded and reflect-padded Whisper input at `positions`."""
+        if len(window) == 0:
+            return np.zeros(positions.shape, dtype=np.float32)
+        positions = np.abs(positions)
+        positions = np.where(positions >= N_SAMPLES, 2 * (N_SAMPLES - 1) - positions, positions)
+        inside = positions < len(window)
+        return np.where(inside, window[np.minimum(positions, len(window) - 1)], 0).astype(np.float32)
+
+    def features(self, start, end):
+        """Whisper input features [n_mels, 3000] and attention mask [3000] of the samples [start, end)."""
+        if start % HOP:
+            raise ValueError(f"window start {start} is not on the {HOP}-sample hop grid")
+        end = min(end, start + N_SAMPLES, self.n_samples)
+        if start < self.audio_start:
+            raise ValueError(f"window start {start} is no longer buffered (from {self.audio_start})")
+        window = self.audio[start - self.audio_start : end - self.audio_start]
+        n = len(window)
+
+        log_spec = np.full((N_FRAMES, self.mel_filters.shape[1]), self.silence, dtype=np.float32)
+        centers = np.arange(N_FRAMES) * HOP
+
+        # frames fully inside the window are the stream's frames, frames fully in the padding
+        # are silence, and the few others (start, end of the audio) are computed here
+        inner = (centers >= N_FFT // 2) & (centers + N_FFT // 2 <= n)
+        silent = (centers - N_FFT // 2 >= n) & (centers + N_FFT // 2 <= N_SAMPLES)
+        edge = np.flatnonzero(~inner & ~silent)
+        inner = np.flatnonzero(inner)
+
+        if len(inner):
+            k0 = start // HOP + inner[0] - self.frames_start
+            log_spec[inner] = self.frames[k0 : k0 + len(inner)]
+        if len(edge):
+            positions = centers[edge, None] - N_FFT // 2 + np.arange(N_FFT)
+            log_spec[edge] = self._log_mel(self._window_samples(window, positions))
+
+        log_spec = np.maximum(log_spec, log_spec.max() - 8.0)
+        features = ((log_spec + 4.0) / 4.0).T
+
+        mask = np.zeros(N_FRAMES, dtype=np.int32)
+        mask[: -(-n // HOP)] = 1
+        return np.ascontiguousarray(features), mask
+
+
+if __name__ == "__main__":
+    import time
+    from transformers import WhisperFeatureExtractor
+
+    from utils.parameters import STEP
+
+    # same windows as the app loop: each step transcribes the previous and the new buffer
+    extractor = WhisperFeatureExtractor(feature_size=80)
+    rng = np.random.default_rng(0)
+    n_steps = 40
+    audio = rng.standard_normal(SR * STEP * (n_steps + 1)).astype(np.float32)
+    audio *= np.repeat(rng.uniform(0.001, 0.3, (n_steps + 1) * STEP * 10), SR // 10).astype(np.float32)
+
+    stream = StreamingLogMel()
+    max_diff, time_stream, time_hf = 0.0, 0.0, 0.0
+    for i in range(n_steps):
+        buffer = audio[i * STEP * SR : (i + 1) * STEP * SR]
+        start = max(0, (i - 1) * STEP * SR)
+
+        t = time.perf_counter()
+        stream.append(buffer)
+        features, mask = stream.features(start, (i + 1) * STEP * SR)
+        time_stream += time.perf_counter() - t
+
+        t = time.perf_counter()
+        reference = extractor(audio[start : (i + 1) * STEP * SR], sampling_rate=SR, return_tensors="np", return_attention_mask=True)
+        time_hf += time.perf_counter() - t
+
+        max_diff = max(max_diff, np.abs(features - reference.input_features[0]).max())
+        assert (mask == reference.attention_mask[0]).all()
+
+    print(f"max abs diff vs WhisperFeatureExtractor: {max_diff:.2e}")
+    print(f"per {STEP}s step | WhisperFeatureExtractor on the {2 * STEP}s window: {time_hf / n_steps * 1e3:.2f} ms"
+          f" | StreamingLogMel (new frames + window): {time_stream / n_steps * 1e3:.2f} ms")
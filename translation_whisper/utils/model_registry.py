@@ -0,0 +1,94 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import torch
+
+
+ModelKey = namedtuple("ModelKey", ["model_id", "device", "dtype", "language"])
+
+
+def model_bytes(obj):
+    """Memory held by the parameters and buffers of a model or pipeline (0 for e.g. tokenizers)."""
+    module = getattr(obj, "model", obj)
+    if not isinstance(module, torch.nn.Module):
+        return 0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def device_memory(device):
+    if str(device).startswith("cuda") and torch.cuda.is_available():
+        return torch.cuda.get_device_properties(torch.device(device)).total_memory
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+class ModelRegistry:
+    """Models loaded once per process, shared by every Streamlit session and rerun.
+
+    `get(key, loader)` returns the model for `key`, calling `loader()` the first time. Models are
+    kept in least recently used order, and once the models of a device take more than
+    `memory_fraction` of its memory, the least recently used ones are dropped. Each entry records
+    its load time, size and number of uses (`stats()`).
+    """
+
+    def __init__(self, memory_fraction=0.7):
+        self.memory_fraction = memory_fraction
+        self._models = OrderedDict()  # key -> model, least recently used first
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self._metrics[key]["uses"] += 1
+                return self._models[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # one load per key, other sessions asking for it wait for the same model
+        with key_lock:
+            with self._lock:
+                if key in self._models:
+                    self._metrics[key]["uses"] += 1
+                    return self._models[key]
+
+            start = time.time()
+            model = loader()
+            load_s = time.time() - start
+
+            with self._lock:
+                self._models[key] = model
+                self._metrics[key] = {"load_s": load_s, "bytes": model_bytes(model), "uses": 1}
+                self._evict(key.device, keep=key)
+            print(f"[models] loaded {key.model_id} ({key.device}, {key.dtype}, {key.language}) in {load_s:.1f}s, "
+                  f"{self._metrics[key]['bytes'] / 2**20:.0f} MB")
+            return model
+
+    def _evict(self, device, keep):
+        budget = self.memory_fraction * device_memory(device)
+        keys = [k for k in self._models if k.device == device and k != keep]
+        used = sum(self._metrics[k]["bytes"] for k in keys + [keep])
+        evicted = False
+        for key in keys:
+            if used <= budget:
+                break
+            del self._models[key]
+            used -= self._metrics.pop(key)["bytes"]
+            evicted = True
+            print(f"[models] evicted {key.model_id} ({key.device}, {key.dtype}, {key.language})")
+
+        if evicted:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def stats(self):
+        with self._lock:
+            return {key: dict(metrics) for key, metrics in self._metrics.items()}
+
+
+registry = ModelRegistry()
@@ -1,5 +1,34 @@
+import os
+
 SR = 16000
 
 STEP = 3
 OVERLAP_PAST = 1
-OVERLAP_FUTURE = 0.2
\ No newline at end of file
+OVERLAP_FUTURE = 0.2
+FEATURE_CACHE = True  # log-mel frames computed once per sample instead of once per window
+ASR_BACKEND = "hf"  # "hf" (transformers pipeline, PyTorch) or "ort" (ONNX Runtime export)
+ASR_MODEL = "openai/whisper-medium"  # hub id or local checkpoint directory (offline)
+# cheaper checkpoints (hub ids or local directories), from the most accurate to the cheapest
+ASR_SMALLER_MODELS = ["openai/whisper-small", "openai/whisper-base"]
+# (model, num_beams), a session moves down the list when it falls behind real time and back up
+# when it has headroom (the next level is loaded once the session gets close to falling behind)
+ASR_LEVELS = [(ASR_MODEL, 1)] + [(model, 1) for model in ASR_SMALLER_MODELS]
+# offline (local ASR_MODEL): only when the smaller checkpoints are local directories too
+ADAPTIVE_ASR = not os.path.isdir(ASR_MODEL) or all(os.path.isdir(model) for model in ASR_SMALLER_MODELS)
+# "fp32", "fp16" (GPU), "int8" (CPU), "float": fp16 with a GPU, fp32 without, or "auto": fp16 with
+# a GPU, int8 without (opt-in until the int8 WER against fp32 is measured, see utils.quantization)
+ASR_PRECISION = "float"
+TRIMMED_ENCODER = False  # encode only the window's frames (+1 s) instead of 30 s, with FEATURE_CACHE
+# cropping of the overlap windows: "word" (word timestamps, DTW alignment), "segment" (segment
+# timestamps, words spread over their segment) or "text" (no timestamps, start found by aligning
+# the text with the previous window's)
+TIMESTAMPS = "word"
+BATCH_SIZE = 8  # windows of concurrent sessions decoded together (1: each session calls the model itself)
+BATCH_WAIT_MS = 5  # how long the inference worker waits for other sessions' windows
+WARM_UP = True  # synthetic passes at the window sizes after loading, so the first subtitle is not slower
+COMPILE = False  # torch.compile the PyTorch models (compiled during the warm-up)
+COMPILE_CACHE_DIR = "~/.cache/translation_whisper/inductor"  # compiled graphs and kernels, kept across restarts
+
+# "overlap": each step re-transcribes the previous window with the new one and crops by timestamp
+# "streaming": growing window prompted with the committed text, words committed by agreement
+ASR_MODE = "overlap"
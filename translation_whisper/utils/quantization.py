@@ -0,0 +1,71 @@
+import torch
+
+
+def resolve_precision(precision):
+    """Resolves "float" to fp16 with a GPU and fp32 on CPU, "auto" to fp16 with a GPU and int8 (dynamic quantization) on CPU."""
+    if precision == "float":
+        return "fp16" if torch.cuda.is_available() else "fp32"
+    if precision == "auto":
+        return "fp16" if torch.cuda.is_available() else "int8"
+    if precision == "fp16" and not torch.cuda.is_available():
+        raise ValueError("fp16 inference needs a GPU, use fp32 or int8 on CPU")
+    return precision
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of the linear layers (weights int8, activations quantized per batch), CPU only."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def word_error_rate(reference, hypothesis):
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    if not ref:
+        return float(len(hyp) > 0)
+    # edit distance over words, one row at a time
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+
+if __name__ == "__main__":
+    import glob
+    import os
+    import sys
+    import time
+
+    import av
+    import numpy as np
+    from transformers import pipeline
+
+    from utils.parameters import SR
+
+    # python -m utils.quantization [model], from translation_whisper
+    model_name = sys.argv[1] if len(sys.argv) > 1 else "openai/whisper-medium"
+    audios = os.path.join(os.path.dirname(__file__), "..", "..", "translation_file", "audios")
+    window = 2 * 3 * SR  # the app's window: previous and current STEP
+
+    def load(path):
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=SR)
+        with av.open(path) as container:
+            frames = [out.to_ndarray()[0] for frame in container.decode(audio=0) for out in resampler.resample(frame)]
+        return np.concatenate(frames + [out.to_ndarray()[0] for out in resampler.resample(None)])
+
+    clips = {os.path.basename(p): load(p) for p in sorted(glob.glob(os.path.join(audios, "*")))}
+    transcripts = {}
+    for precision in ("fp32", "int8"):
+        asr = pipeline("automatic-speech-recognition", model=model_name, device=-1, dtype=torch.float32)
+        if precision == "int8":
+            quantize_int8(asr.model)
+        asr(np.zeros(SR, dtype=np.float32))  # warm-up
+
+        for name, audio in clips.items():
+            start = time.perf_counter()
+            texts = [asr(audio[i : i + window])["text"] for i in range(0, len(audio), window)]
+            rtf = (time.perf_counter() - start) / (len(audio) / SR)
+            transcripts[precision, name] = " ".join(t.strip() for t in texts)
+            wer = "" if precision == "fp32" else f" | WER vs fp32 {word_error_rate(transcripts['fp32', name], transcripts[precision, name]):.1%}"
+            print(f"{precision} | {name} ({len(audio) / SR:.0f}s) | RTF {rtf:.2f}{wer}")
+        del asr
@@ -0,0 +1,80 @@
+from collections import deque
+
+
+class RTFController:
+    """Picks the ASR level (checkpoint, beams) of a session from its measured real-time factor.
+
+    `levels` goes from the most accurate to the cheapest setting, as (model, num_beams). After each
+    step, `update(duration)` records how long the step took against the `budget` (the audio it
+    covers, STEP). Once the mean real-time factor of the last `window` steps goes above `high`,
+    the session moves one level down, once it goes below `low` it moves back up. A switch clears
+    the history, so the next decision is made on durations of the new level only.
+
+    `standby` is the next cheaper level, to load once `needs_standby` (the RTF went above
+    `standby_rtf`) so a switch down does not wait for a model load, without keeping it in memory
+    while the session keeps up (the level above was in use before and is still loaded).
+    """
+
+    def __init__(self, levels, budget, high=0.9, low=0.45, standby_rtf=0.7, window=4):
+        self.levels = list(levels)
+        self.budget = budget
+        self.high = high
+        self.low = low
+        self.standby_rtf = standby_rtf
+        self.durations = deque(maxlen=window)
+        self.index = 0
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    @property
+    def standby(self):
+        return self.levels[min(self.index + 1, len(self.levels) - 1)]
+
+    @property
+    def needs_standby(self):
+        return self.index < len(self.levels) - 1 and self.rtf > self.standby_rtf
+
+    @property
+    def rtf(self):
+        if not self.durations:
+            return 0.0
+        return sum(self.durations) / len(self.durations) / self.budget
+
+    def update(self, duration):
+        """Records a step duration (s), returns True when the level changed."""
+        self.durations.append(duration)
+        if len(self.durations) < self.durations.maxlen:
+            return False
+
+        rtf = self.rtf
+        if rtf > self.high and self.index < len(self.levels) - 1:
+            self.index += 1
+        elif rtf < self.low and self.index > 0:
+            self.index -= 1
+        else:
+            return False
+
+        print(f"[asr] RTF {rtf:.2f} over the last {len(self.durations)} steps, switching to {self.level[0]} (beams {self.level[1]})")
+        self.durations.clear()
+        return True
+
+
+if __name__ == "__main__":
+    from utils.parameters import STEP, ASR_LEVELS
+
+    # simulated step durations: each level costs about half the previous one, and the machine
+    # is loaded (x2.5) between steps 20 and 50
+    base_cost = [2.2, 1.0, 0.45][: len(ASR_LEVELS)]
+    for levels in (ASR_LEVELS[:1], ASR_LEVELS):
+        controller = RTFController(levels, STEP)
+        trace, lag, max_lag = [], 0.0, 0.0
+        for step in range(80):
+            load = 2.5 if 20 <= step < 50 else 1.0
+            duration = base_cost[controller.index] * load
+            lag = max(0.0, lag + duration - STEP)  # audio waiting to be processed
+            max_lag = max(max_lag, lag)
+            trace.append(str(controller.index))
+            controller.update(duration)
+        print(f"{len(levels)} level(s) | levels per step: {''.join(trace)} | max lag behind the speaker: {max_lag:.1f}s")
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """Streaming energy-based voice activity detector, run frame by frame on 16 kHz audio.
+
+    A frame is speech-like when its level is `threshold_db` above the tracked noise floor
+    and above `min_speech_db`. Speech starts after `start_s` of consecutive speech-like
+    frames and the utterance ends after `hangover_s` without any, which raises
+    `utterance_ended` until it is consumed.
+    """
+
+    def __init__(self, sr, frame_s=0.03, threshold_db=9, min_speech_db=-50,
+                 start_s=0.09, hangover_s=0.5, floor_rise_db_s=0.5):
+        self.frame_len = int(frame_s * sr)
+        self.threshold_db = threshold_db
+        self.min_speech_db = min_speech_db
+        self.start_frames = max(1, round(start_s / frame_s))
+        self.hangover_frames = max(1, round(hangover_s / frame_s))
+        self.floor_rise_db = floor_rise_db_s * frame_s
+
+        self.noise_floor_db = None
+        self.in_speech = False
+        self.utterance_ended = False
+        self._rest = np.zeros(0, dtype=np.float32)
+        self._run, self._silence_run = 0, 0
+        self.reset()
+
+    def reset(self):
+        """Forgets the speech counted so far, an utterance in progress carries over."""
+        self.speech_frames = 0
+
+    @property
+    def has_speech(self):
+        return self.in_speech or self.speech_frames > 0
+
+    def pop_endpoint(self):
+        ended, self.utterance_ended = self.utterance_ended, False
+        return ended
+
+    def process(self, audio):
+        audio = np.concatenate((self._rest, np.asarray(audio, dtype=np.float32)))
+        n_frames = len(audio) // self.frame_len
+        self._rest = audio[n_frames * self.frame_len:]
+        if n_frames == 0:
+            return
+
+        frames = audio[: n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        levels = 10 * np.log10(np.einsum("ij,ij->i", frames, frames) / self.frame_len + 1e-12)
+        for level in levels:
+            self._update(level)
+
+    def _update(self, level):
+        if self.noise_floor_db is None:
+            self.noise_floor_db = level
+        is_speech = level > max(self.noise_floor_db + self.threshold_db, self.min_speech_db)
+
+        # the floor follows quiet frames immediately and only creeps up outside speech
+        if level < self.noise_floor_db:
+            self.noise_floor_db = level
+        elif not self.in_speech:
+            self.noise_floor_db = min(level, self.noise_floor_db + self.floor_rise_db)
+
+        if is_speech:
+            self._run += 1
+            self._silence_run = 0
+        else:
+            self._run = 0
+            self._silence_run += 1
+
+        if not self.in_speech and self._run >= self.start_frames:
+            self.in_speech = True
+        elif self.in_speech and self._silence_run >= self.hangover_frames:
+            self.in_speech = False
+            self.utterance_ended = True
+
+        if self.in_speech:
+            self.speech_frames += 1
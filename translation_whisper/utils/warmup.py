@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import torch
+
+
+def enable_compile_cache(directory):
+    """Keeps the inductor caches (FX graphs, generated kernels) in `directory`, reused by later processes."""
+    directory = os.path.expanduser(directory)
+    os.makedirs(directory, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = directory
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+
+
+def compile_model(model):
+    """torch.compile of the forward of `model`, with dynamic shapes (window and token counts vary).
+
+    Compilation happens on the first calls, hence the warm-up passes after loading.
+    """
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def synthetic_speech(n_samples, sr, seed=0):
+    """Noise with a syllable-rate envelope at a speech level, for warm-up passes."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / sr
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) * 0.1
+    return (rng.standard_normal(n_samples) * envelope).astype(np.float32)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from transformers import WhisperConfig, WhisperForConditionalGeneration
+
+    from utils.parameters import COMPILE_CACHE_DIR
+
+    # first and second generate of a process, eager or compiled: run twice to see the disk cache
+    # python -m utils.warmup [eager|compile], from translation_whisper
+    mode = sys.argv[1] if len(sys.argv) > 1 else "compile"
+    enable_compile_cache(COMPILE_CACHE_DIR)
+    torch.manual_seed(0)
+    config = WhisperConfig(
+        d_model=512, encoder_layers=6, encoder_attention_heads=8, encoder_ffn_dim=2048,
+        decoder_layers=6, decoder_attention_heads=8, decoder_ffn_dim=2048, num_mel_bins=80,
+    )
+    model = WhisperForConditionalGeneration(config).eval()
+    generation_config = model.generation_config
+    generation_config.decoder_start_token_id = config.decoder_start_token_id
+    generation_config.eos_token_id = generation_config.pad_token_id = config.eos_token_id
+    if mode == "compile":
+        compile_model(model)
+
+    features = torch.randn(1, config.num_mel_bins, 3000)
+    for call in ("first", "second", "third"):
+        start = time.perf_counter()
+        with torch.no_grad():
+            model.generate(input_features=features, max_new_tokens=10, min_new_tokens=10)
+        print(f"{mode} | {call} call: {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,81 @@
+import inspect
+
+import torch
+from torch import nn
+from transformers.modeling_outputs import BaseModelOutput
+
+
+def enable_trimmed_encoder(model):
+    """Lets the Whisper encoder of `model` run on fewer than 3000 mel frames.
+
+    The HF encoder only accepts 30 s inputs, so a 3-8 s window is mostly encoded padding. The
+    replacement forward takes any even number of frames up to 3000 and uses the matching first
+    positional embeddings (whisper.cpp's `audio_ctx`). The decoder cross-attends to the shorter
+    output as is, and `generate` treats the input as a short-form one.
+    """
+    encoder = model.get_encoder()
+    max_frames = encoder.config.max_source_positions * encoder.conv1.stride[0] * encoder.conv2.stride[0]
+    layer_params = inspect.signature(encoder.layers[0].forward).parameters
+    layer_kwargs = {"layer_head_mask": None} if "layer_head_mask" in layer_params else {}
+
+    def forward(input_features, attention_mask=None, **kwargs):
+        if input_features.shape[-1] > max_frames:
+            raise ValueError(f"Whisper encodes at most {max_frames} mel frames, got {input_features.shape[-1]}")
+
+        hidden_states = nn.functional.gelu(encoder.conv1(input_features))
+        hidden_states = nn.functional.gelu(encoder.conv2(hidden_states)).permute(0, 2, 1)
+        hidden_states = hidden_states + encoder.embed_positions.weight[: hidden_states.shape[1]]
+
+        for layer in encoder.layers:
+            out = layer(hidden_states, None, **layer_kwargs)
+            hidden_states = out[0] if isinstance(out, tuple) else out
+        return BaseModelOutput(last_hidden_state=encoder.layer_norm(hidden_states))
+
+    encoder.forward = forward
+    return model
+
+
+def trim_features(features, mask, margin_frames=100):
+    """Keeps the frames of the audio (from the attention mask) plus `margin_frames` of padding, an even number."""
+    n_frames = int(mask.sum()) + margin_frames
+    n_frames = min(features.shape[-1], n_frames + n_frames % 2)
+    return features[..., :n_frames], mask[..., :n_frames]
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from transformers import WhisperConfig, WhisperForConditionalGeneration
+
+    from utils.parameters import STEP
+
+    # encoder cost does not depend on the weights: whisper-medium dimensions, random weights
+    config = WhisperConfig(
+        d_model=1024, encoder_layers=24, encoder_attention_heads=16, encoder_ffn_dim=4096,
+        decoder_layers=2, decoder_attention_heads=16, decoder_ffn_dim=4096, num_mel_bins=80,
+    )
+    if len(sys.argv) > 1:
+        config = WhisperConfig.from_pretrained(sys.argv[1])
+    model = WhisperForConditionalGeneration(config).eval()
+    encoder = model.get_encoder()
+    repeats = 3
+
+    def timed(features):
+        with torch.no_grad():
+            encoder(features)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                encoder(features)
+        return (time.perf_counter() - start) / repeats
+
+    full = torch.randn(1, config.num_mel_bins, 3000)
+    time_full = timed(full)
+    print(f"torch threads: {torch.get_num_threads()} | full 30 s encoder: {time_full * 1e3:.0f} ms")
+
+    enable_trimmed_encoder(model)
+    for window_s in (STEP, 2 * STEP, 8):
+        mask = torch.zeros(3000, dtype=torch.int32)
+        mask[: window_s * 100] = 1
+        features, _ = trim_features(full, mask)
+        time_trimmed = timed(features)
+        print(f"{window_s} s window ({features.shape[-1]} frames): {time_trimmed * 1e3:.0f} ms, x{time_full / time_trimmed:.1f}")